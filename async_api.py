@@ -0,0 +1,301 @@
+"""Async API tier for Chore Champions.
+
+Serves the JSON read routes, task completions and a server-sent event stream
+from an async SQLAlchemy engine (aiosqlite / asyncpg) under an ASGI server:
+
+    hypercorn async_api:application --bind 0.0.0.0:5000
+
+``application`` answers the routes defined here and hands every other request
+(HTML pages, parent admin writes) to the Flask app in main.py, so one process
+can serve the whole site. Models and business rules are shared with the Flask
+app; sync service functions run via ``AsyncSession.run_sync``.
+"""
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytz
+from quart import Quart, Response, request, jsonify, session
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+
+from models import (
+    Base, create_async_database, upgrade_schema, get_or_create_settings, household_session,
+    DEFAULT_HOUSEHOLD_ID, READ_METHODS, READ_YOUR_WRITES_SECONDS, ChangeLog, Child, Settings, Task, TaskCompletion
+)
+from services import (
+    get_week_start_date, record_completion, household_local_time, household_today
+)
+from recurrence import ensure_occurrences
+from streaks import current_streak
+from serializers import (
+    ChildWeekDTO, TaskDTO, DueTaskDTO, RecentCompletionDTO, JSON_MIMETYPE, dumps
+)
+
+app = Quart(__name__)
+app.secret_key = os.environ.get('SESSION_SECRET', 'chore-champions-secret-key')
+
+# Seconds between keep-alive comments on idle event streams
+EVENT_HEARTBEAT_SECONDS = 15
+
+# Seconds between change log polls that feed the event streams
+EVENT_POLL_SECONDS = 1
+
+# Change log rows read per poll
+EVENT_POLL_BATCH = 500
+
+engine = None
+Session = None
+_watcher = None
+
+# Connected event streams: queue -> household_id
+_subscribers = {}
+
+@app.before_serving
+async def startup():
+    """Create the async engine and make sure tables exist"""
+    global engine, Session
+    engine, Session = create_async_database()
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(upgrade_schema)
+    global _watcher
+    _watcher = asyncio.create_task(watch_completions())
+
+@app.after_serving
+async def shutdown():
+    """Stop the change log watcher and release pooled connections"""
+    _watcher.cancel()
+    await engine.dispose()
+
+def scoped_session():
+    """Async session limited to the household chosen on this browser (reads as in main.get_session)"""
+    read_replica = request.method in READ_METHODS and time.time() >= session.get('primary_until', 0)
+    return household_session(Session, session.get('household_id', DEFAULT_HOUSEHOLD_ID), read_replica)
+
+@app.after_request
+async def read_own_writes(response):
+    """Keep a client on the primary for a few seconds after it writes"""
+    if Session.kw['replica'] is not None and request.method not in READ_METHODS and response.status_code < 400:
+        session['primary_until'] = time.time() + READ_YOUR_WRITES_SECONDS
+    return response
+
+def publish_event(household_id, event_type, payload):
+    """Push an event to every stream connected for a household"""
+    for queue, subscribed_household in list(_subscribers.items()):
+        if subscribed_household == household_id:
+            queue.put_nowait((event_type, payload))
+
+async def publish_changes(cursor):
+    """Publish the approved completions logged after ``cursor``; returns the new cursor"""
+    async with Session() as session_db:
+        changes = (await session_db.execute(
+            select(ChangeLog.id, ChangeLog.table_name, ChangeLog.row_id, ChangeLog.operation).where(
+                ChangeLog.id > cursor
+            ).order_by(ChangeLog.id).limit(EVENT_POLL_BATCH)
+        )).all()
+        if not changes:
+            return cursor
+
+        completion_ids = {
+            row_id for _, table_name, row_id, operation in changes
+            if table_name == 'task_completions' and operation != 'delete'
+        }
+        if completion_ids and _subscribers:
+            rows = await session_db.execute(
+                select(
+                    TaskCompletion.household_id, TaskCompletion.child_id, TaskCompletion.task_id,
+                    Child.xp, Child.level, Child.streak_count, Child.last_completion_date, Settings.timezone
+                ).join(Child, Child.id == TaskCompletion.child_id).outerjoin(
+                    Settings, Settings.household_id == TaskCompletion.household_id
+                ).where(
+                    TaskCompletion.id.in_(completion_ids),
+                    TaskCompletion.approved == True
+                ).order_by(TaskCompletion.id)
+            )
+            now = pytz.UTC.localize(datetime.utcnow())
+            for household_id, child_id, task_id, xp, level, streak_count, last_completion_date, tz_name in rows:
+                # This poll reads every household, so each one's today comes from its own timezone
+                today = now.astimezone(pytz.timezone(tz_name or 'Europe/London')).date()
+                publish_event(household_id, 'completion', {
+                    'child_id': child_id,
+                    'task_id': task_id,
+                    'total_xp': xp,
+                    'level': level,
+                    'streak_count': current_streak(streak_count, last_completion_date, today)
+                })
+        return changes[-1][0]
+
+async def watch_completions():
+    """Feed the event streams from the change log.
+
+    Every tier and process (Flask routes, offline replay, parent approvals and
+    this app) logs its completion writes there, so connected dashboards see
+    all of them rather than only those recorded in this process.
+    """
+    async with Session() as session_db:
+        cursor = await session_db.scalar(select(func.max(ChangeLog.id))) or 0
+    while True:
+        await asyncio.sleep(EVENT_POLL_SECONDS)
+        try:
+            cursor = await publish_changes(cursor)
+        except Exception:
+            pass  # a failed poll is retried from the same cursor
+
+def json_response(payload, status=200):
+    """Quart response for a payload encoded with serializers.dumps"""
+    return Response(dumps(payload), status=status, mimetype=JSON_MIMETYPE)
+
+@app.route('/api/children')
+async def api_children():
+    """Get all children with weekly stats"""
+    async with scoped_session() as session_db:
+        today = await session_db.run_sync(household_today)
+        rows = await session_db.execute(ChildWeekDTO.select(get_week_start_date(today), today))
+        return json_response(ChildWeekDTO.from_rows(rows))
+
+@app.route('/api/tasks')
+async def api_tasks():
+    """Get all tasks"""
+    async with scoped_session() as session_db:
+        return json_response(TaskDTO.from_rows(await session_db.execute(TaskDTO.select_active())))
+
+@app.route('/api/tasks/today')
+async def api_tasks_today():
+    """Get today's tasks for a specific child"""
+    child_id = request.args.get('child_id', type=int)
+    if not child_id:
+        return jsonify({'error': 'child_id required'}), 400
+
+    async with scoped_session() as session_db:
+        today = await session_db.run_sync(household_today)
+
+        await session_db.run_sync(ensure_occurrences, today)
+        rows = await session_db.execute(DueTaskDTO.select(child_id, today))
+        return json_response(DueTaskDTO.from_rows(rows))
+
+@app.route('/api/settings')
+async def api_settings():
+    """Get current settings"""
+    async with scoped_session() as session_db:
+        settings = await session_db.run_sync(get_or_create_settings)
+        return json_response({
+            'full_payout_amount': settings.full_payout_amount,
+            'threshold_rules': settings.get_threshold_rules(),
+            'timezone': settings.timezone
+        })
+
+@app.route('/api/completions', methods=['POST'])
+async def api_complete_task():
+    """Complete a task for a child"""
+    data = await request.get_json()
+    child_id = data.get('child_id')
+    task_id = data.get('task_id')
+
+    if not child_id or not task_id:
+        return jsonify({'error': 'child_id and task_id required'}), 400
+
+    async with scoped_session() as session_db:
+        try:
+            child = await session_db.get(Child, child_id)
+            task = await session_db.get(Task, task_id)
+
+            if not child or not task or task.archived_at is not None:
+                return jsonify({'error': 'Child or task not found'}), 404
+
+            timestamp, today, local_minute = await session_db.run_sync(household_local_time)
+
+            existing = await session_db.scalar(
+                select(TaskCompletion.id).where(
+                    TaskCompletion.child_id == child_id,
+                    TaskCompletion.task_id == task_id,
+                    TaskCompletion.date == today
+                ).limit(1)
+            )
+            if existing:
+                return jsonify({'error': 'Task already completed today'}), 400
+
+            result = await session_db.run_sync(
+                lambda sync_session: record_completion(
+                    sync_session, child, task, today, timestamp, local_minute
+                )
+            )
+
+            return jsonify(result)
+
+        except IntegrityError:
+            # A concurrent request completed it first
+            await session_db.rollback()
+            return jsonify({'error': 'Task already completed today'}), 400
+        except Exception as e:
+            await session_db.rollback()
+            return jsonify({'error': str(e)}), 500
+
+@app.route('/api/completions/recent')
+async def get_recent_completions():
+    """Get recent completions from the last 7 days"""
+    if not session.get('is_parent'):
+        return jsonify({'error': 'Admin access required'}), 403
+
+    async with scoped_session() as session_db:
+        seven_days_ago = (await session_db.run_sync(household_today)) - timedelta(days=7)
+
+        rows = await session_db.execute(RecentCompletionDTO.select(seven_days_ago))
+        return json_response(RecentCompletionDTO.from_rows(rows))
+
+@app.route('/api/events')
+async def api_events():
+    """Server-sent event stream of the household's approved completions for live dashboards.
+
+    Events come from the change log, so completions recorded by any tier or
+    worker appear within EVENT_POLL_SECONDS.
+    """
+    queue = asyncio.Queue()
+    _subscribers[queue] = session.get('household_id', DEFAULT_HOUSEHOLD_ID)
+
+    async def stream():
+        try:
+            while True:
+                try:
+                    event_type, payload = await asyncio.wait_for(
+                        queue.get(), timeout=EVENT_HEARTBEAT_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    yield b': keep-alive\n\n'
+                    continue
+                yield f"event: {event_type}\ndata: {json.dumps(payload)}\n\n".encode()
+        finally:
+            _subscribers.pop(queue, None)
+
+    response = await app.make_response((stream(), {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    }))
+    response.timeout = None
+    return response
+
+def _handled_here(scope):
+    """True if the Quart app has a route for this HTTP request"""
+    adapter = app.url_map.bind('localhost')
+    try:
+        adapter.match(scope['path'], method=scope['method'])
+    except Exception:
+        return False
+    return True
+
+_flask_app = None
+
+async def application(scope, receive, send):
+    """ASGI entry point: async routes here, everything else to the Flask app from main.create_app"""
+    global _flask_app
+    if scope['type'] == 'http' and not _handled_here(scope):
+        if _flask_app is None:
+            from hypercorn.middleware import AsyncioWSGIMiddleware
+            import main
+            _flask_app = AsyncioWSGIMiddleware(main.create_app())
+        await _flask_app(scope, receive, send)
+        return
+    await app(scope, receive, send)
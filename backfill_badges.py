@@ -0,0 +1,229 @@
+"""One-pass historical badge backfill.
+
+Replays each child's full completion history in date order, evaluating the
+streak, Morning Hero, All-Green Day and Tidy Master rules in memory, and
+inserts any badges that are missing. History is read in keyset-paginated
+pages, so memory stays bounded however long the history is, and progress is
+checkpointed per child at day boundaries so an interrupted run resumes where
+it stopped. Children that finished are skipped on later runs; use --restart
+after importing history or changing badge rules.
+
+    python backfill_badges.py              # all children, resuming if possible
+    python backfill_badges.py --child 2    # one child
+    python backfill_badges.py --restart    # ignore saved checkpoints
+"""
+import argparse
+from datetime import date, timedelta
+
+from sqlalchemy import and_, case, func, or_
+
+from models import (
+    create_database, household_ids, household_session, BadgeBackfillCheckpoint,
+    Badge, Child, Task, TaskCompletion, TaskOccurrence
+)
+from recurrence import ensure_occurrences, ensure_occurrences_since
+from services import (
+    household_today, make_badge, MORNING_HERO_TASKS, MORNING_CUTOFF_HOUR,
+    STREAK_STAR_DAYS, TIDY_MASTER_COUNT
+)
+
+# Completion rows fetched per query
+PAGE_SIZE = 1000
+
+# Days replayed between checkpoint commits
+CHECKPOINT_EVERY_DAYS = 30
+
+# Badges a child can only earn once (All-Green Day is once per day)
+ONCE_ONLY_BADGES = ("Morning Hero", "Streak Star", "Tidy Master")
+
+def load_due_counts(session, start, end):
+    """Required tasks due per day: date -> (daily, daily_or_weekly), one grouped query"""
+    is_daily = Task.category == 'DAILY'
+    is_daily_or_weekly = Task.category.in_(['DAILY', 'WEEKLY'])
+    rows = session.query(
+        TaskOccurrence.due_date,
+        func.sum(case((is_daily, 1), else_=0)),
+        func.sum(case((is_daily_or_weekly, 1), else_=0))
+    ).join(Task, Task.id == TaskOccurrence.task_id).filter(
+        Task.is_required == True,
+        TaskOccurrence.due_date >= start,
+        TaskOccurrence.due_date <= end
+    ).group_by(TaskOccurrence.due_date).all()
+    return {due_date: (int(daily or 0), int(both or 0)) for due_date, daily, both in rows}
+
+def iter_completions(session, child_id, after_date):
+    """Yield (id, date, local_minute, category, is_required, task_name) in date order, page by page"""
+    last_date, last_id = after_date, None
+    while True:
+        query = session.query(
+            TaskCompletion.id, TaskCompletion.date, TaskCompletion.local_minute,
+            Task.category, Task.is_required, Task.name
+        ).join(Task, Task.id == TaskCompletion.task_id).filter(
+            TaskCompletion.child_id == child_id,
+            TaskCompletion.approved == True
+        )
+        if last_id is not None:
+            query = query.filter(or_(
+                TaskCompletion.date > last_date,
+                and_(TaskCompletion.date == last_date, TaskCompletion.id > last_id)
+            ))
+        elif last_date is not None:
+            query = query.filter(TaskCompletion.date > last_date)
+
+        page = query.order_by(TaskCompletion.date, TaskCompletion.id).limit(PAGE_SIZE).all()
+        if not page:
+            return
+        yield from page
+        last_date, last_id = page[-1].date, page[-1].id
+
+class BadgeReplay:
+    """In-memory badge rule state for one child, advanced one day at a time"""
+
+    def __init__(self, earned, state=None):
+        state = state or {}
+        self.earned = earned  # set of once-only badge names already held
+        self.streak = state.get('streak', 0)
+        self.last_streak_date = date.fromisoformat(state['last_streak_date']) if state.get('last_streak_date') else None
+        self.tidy_count = state.get('tidy_count', 0)
+
+    def to_state(self):
+        return {
+            'streak': self.streak,
+            'last_streak_date': self.last_streak_date.isoformat() if self.last_streak_date else None,
+            'tidy_count': self.tidy_count
+        }
+
+    def replay_day(self, day, rows, due_counts):
+        """Apply one day's completions; return names of badges earned that day"""
+        earned_today = []
+        due_daily, due_daily_or_weekly = due_counts.get(day, (0, 0))
+        morning = sum(
+            1 for r in rows
+            if r.local_minute is not None and r.local_minute < MORNING_CUTOFF_HOUR * 60
+        )
+        if morning >= MORNING_HERO_TASKS:
+            earned_today.append("Morning Hero")
+
+        required_done = sum(1 for r in rows if r.is_required and r.category in ('DAILY', 'WEEKLY'))
+        if due_daily_or_weekly and required_done >= due_daily_or_weekly:
+            earned_today.append("All-Green Day")
+
+        # A required daily task done on a day one was due extends the streak
+        if due_daily and any(r.is_required and r.category == 'DAILY' for r in rows):
+            if self.last_streak_date == day - timedelta(days=1):
+                self.streak += 1
+            else:
+                self.streak = 1
+            self.last_streak_date = day
+        if self.streak >= STREAK_STAR_DAYS:
+            earned_today.append("Streak Star")
+
+        self.tidy_count += sum(1 for r in rows if r.name == "Tidy Room")
+        if self.tidy_count >= TIDY_MASTER_COUNT:
+            earned_today.append("Tidy Master")
+
+        new_badges = [name for name in earned_today if name not in self.earned]
+        self.earned.update(name for name in new_badges if name in ONCE_ONLY_BADGES)
+        return new_badges
+
+def backfill_child(session, child_id, restart=False):
+    """Replay one child's history and insert missing badges; returns how many were added"""
+    checkpoint = session.get(BadgeBackfillCheckpoint, child_id)
+    if checkpoint is None:
+        checkpoint = BadgeBackfillCheckpoint(child_id=child_id)
+        session.add(checkpoint)
+    elif restart:
+        checkpoint.processed_through = None
+        checkpoint.state = None
+        checkpoint.finished = False
+    elif checkpoint.finished:
+        return 0
+
+    earned = {name for (name,) in session.query(Badge.name).filter(
+        Badge.child_id == child_id,
+        Badge.name.in_(ONCE_ONLY_BADGES)
+    )}
+    green_days = {day for (day,) in session.query(Badge.earned_date).filter(
+        Badge.child_id == child_id,
+        Badge.name == "All-Green Day"
+    )}
+    replay = BadgeReplay(earned, checkpoint.state)
+
+    bounds = session.query(func.min(TaskCompletion.date), func.max(TaskCompletion.date)).filter(
+        TaskCompletion.child_id == child_id
+    ).one()
+    due_counts = load_due_counts(session, *bounds) if bounds[0] else {}
+
+    added = 0
+    pending = []
+    day, day_rows, days_since_checkpoint = None, [], 0
+
+    def finish_day():
+        nonlocal added, days_since_checkpoint
+        for name in replay.replay_day(day, day_rows, due_counts):
+            if name == "All-Green Day" and day in green_days:
+                continue
+            pending.append(make_badge(child_id, name, day))
+        checkpoint.processed_through = day
+        checkpoint.state = replay.to_state()
+        days_since_checkpoint += 1
+        if days_since_checkpoint >= CHECKPOINT_EVERY_DAYS:
+            session.add_all(pending)
+            added += len(pending)
+            pending.clear()
+            session.commit()
+            days_since_checkpoint = 0
+
+    for row in iter_completions(session, child_id, checkpoint.processed_through):
+        if row.date != day:
+            if day is not None:
+                finish_day()
+            day, day_rows = row.date, []
+        day_rows.append(row)
+    if day is not None:
+        finish_day()
+
+    session.add_all(pending)
+    added += len(pending)
+    checkpoint.finished = True
+    session.commit()
+    return added
+
+def backfill_badges(session, child_ids=None, restart=False):
+    """Backfill badges for the given children (default: all); returns {child_id: added}"""
+    query = session.query(Child.id).order_by(Child.id)
+    if child_ids is not None:
+        query = query.filter(Child.id.in_(child_ids))
+    child_ids = [child_id for (child_id,) in query]
+
+    # Due counts come from the occurrence index, which starts when tasks were
+    # first expanded; imported history can reach further back
+    ensure_occurrences(session, household_today(session))
+    first_day = session.query(func.min(TaskCompletion.date)).filter(
+        TaskCompletion.child_id.in_(child_ids),
+        TaskCompletion.approved == True
+    ).scalar()
+    if first_day is not None:
+        ensure_occurrences_since(session, first_day)
+    return {child_id: backfill_child(session, child_id, restart) for child_id in child_ids}
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill badges from completion history")
+    parser.add_argument('--child', type=int, action='append', help="only this child id (repeatable)")
+    parser.add_argument('--restart', action='store_true', help="ignore saved checkpoints")
+    args = parser.parse_args()
+
+    engine, Session = create_database()
+    with Session() as session:
+        households = household_ids(session)
+
+    for household_id in households:
+        session = household_session(Session, household_id)
+        try:
+            for child_id, added in backfill_badges(session, args.child, args.restart).items():
+                print(f"Child {child_id}: {added} badge(s) added")
+        finally:
+            session.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""Per-child completion bitmaps for calendar heatmaps and streaks.
+
+Each (child, task, year) has a ``CompletionBitmap`` of BITMAP_BYTES bytes
+with bit n set when the child has an approved completion of that task on
+day n of the year (bit 0 = 1 January). The ledger sets a bit on every
+completion event and clears it on removal. Calendars and "all required
+done" days are then computed with integer bit operations rather than by
+walking ``task_completions`` a date at a time; streaks come from the
+child's streak segments (see streaks.py).
+"""
+import calendar
+from datetime import date
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session as OrmSession
+
+from models import BITMAP_BYTES, CompletionBitmap, Task, TaskCompletion, TaskOccurrence
+
+# session.info key: completions removed in the current transaction
+REMOVED_KEY = 'calendar_removed_completion_ids'
+
+def day_bit(day):
+    """Bit for a date within its year's bitmap"""
+    return 1 << (day.timetuple().tm_yday - 1)
+
+def to_int(bits):
+    return int.from_bytes(bits, 'little')
+
+def to_bytes(value):
+    return value.to_bytes(BITMAP_BYTES, 'little')
+
+def _locked_bitmap(session, child_id, task_id, year):
+    return session.query(CompletionBitmap).filter(
+        CompletionBitmap.child_id == child_id,
+        CompletionBitmap.task_id == task_id,
+        CompletionBitmap.year == year
+    ).with_for_update().first()
+
+def set_completion_bit(session, child_id, task_id, day):
+    """Mark a day as completed for a child's task. Caller commits."""
+    bitmap = _locked_bitmap(session, child_id, task_id, day.year)
+    if bitmap is None:
+        bitmap = CompletionBitmap(child_id=child_id, task_id=task_id, year=day.year, bits=to_bytes(0))
+        session.add(bitmap)
+    bitmap.bits = to_bytes(to_int(bitmap.bits) | day_bit(day))
+
+def clear_completion_bits(session, task_id, completions):
+    """Unmark the days of a task's completions being removed. Caller deletes them and commits.
+
+    ``completions`` are rows with id, child_id and date. A day stays marked
+    while another approved completion of the task remains on it.
+    """
+    removed = session.info.setdefault(REMOVED_KEY, set())
+    removed.update(row.id for row in completions)
+    keys = {(row.child_id, row.date) for row in completions}
+    if not keys:
+        return
+
+    remaining = set(session.query(TaskCompletion.child_id, TaskCompletion.date).filter(
+        TaskCompletion.task_id == task_id,
+        TaskCompletion.child_id.in_({child_id for child_id, _ in keys}),
+        TaskCompletion.date.in_({day for _, day in keys}),
+        TaskCompletion.approved == True,
+        TaskCompletion.id.notin_(removed)
+    ).distinct().all())
+
+    cleared = {}
+    for child_id, day in keys - remaining:
+        key = (child_id, day.year)
+        cleared[key] = cleared.get(key, 0) | day_bit(day)
+    for (child_id, year), mask in cleared.items():
+        bitmap = _locked_bitmap(session, child_id, task_id, year)
+        if bitmap is None:
+            continue
+        value = to_int(bitmap.bits) & ~mask
+        if value:
+            bitmap.bits = to_bytes(value)
+        else:
+            session.delete(bitmap)
+
+def rebuild_completion_bitmaps(session, child_id):
+    """Replace a child's bitmaps with ones built from its approved completions. Caller commits."""
+    for bitmap in session.query(CompletionBitmap).filter(CompletionBitmap.child_id == child_id):
+        session.delete(bitmap)
+    session.flush()
+
+    bits = {}
+    for task_id, day in session.query(TaskCompletion.task_id, TaskCompletion.date).filter(
+        TaskCompletion.child_id == child_id,
+        TaskCompletion.approved == True,
+        TaskCompletion.date != None
+    ).distinct():
+        key = (task_id, day.year)
+        bits[key] = bits.get(key, 0) | day_bit(day)
+    session.add_all([
+        CompletionBitmap(child_id=child_id, task_id=task_id, year=year, bits=to_bytes(value))
+        for (task_id, year), value in bits.items()
+    ])
+
+@event.listens_for(OrmSession, 'after_commit')
+@event.listens_for(OrmSession, 'after_rollback')
+def _forget_removed(session):
+    session.info.pop(REMOVED_KEY, None)
+
+def _year_offset(year, first_year):
+    """Bit offset of 1 January ``year`` in a bitmap starting at 1 January ``first_year``"""
+    return (date(year, 1, 1) - date(first_year, 1, 1)).days
+
+def _due_bits(session, first_year, last_year, categories):
+    """task_id -> bitmap (from 1 January first_year) of days a required task was due"""
+    due = {}
+    for task_id, due_date in session.query(TaskOccurrence.task_id, TaskOccurrence.due_date).join(
+        Task, Task.id == TaskOccurrence.task_id
+    ).filter(
+        Task.category.in_(categories),
+        Task.is_required == True,
+        TaskOccurrence.due_date >= date(first_year, 1, 1),
+        TaskOccurrence.due_date <= date(last_year, 12, 31)
+    ):
+        offset = (due_date - date(first_year, 1, 1)).days
+        due[task_id] = due.get(task_id, 0) | (1 << offset)
+    return due
+
+def _done_bits(session, child_id, first_year=None, last_year=None, categories=None):
+    """task_id -> bitmap (from 1 January first_year) of days the child completed the task"""
+    query = session.query(CompletionBitmap.task_id, CompletionBitmap.year, CompletionBitmap.bits).filter(
+        CompletionBitmap.child_id == child_id
+    )
+    if first_year is not None:
+        query = query.filter(CompletionBitmap.year >= first_year, CompletionBitmap.year <= last_year)
+    if categories is not None:
+        query = query.join(Task, Task.id == CompletionBitmap.task_id).filter(
+            Task.category.in_(categories),
+            Task.is_required == True
+        )
+    rows = query.all()
+    if first_year is None:
+        first_year = min((year for _, year, _ in rows), default=date.today().year)
+        last_year = max((year for _, year, _ in rows), default=first_year)
+
+    done = {}
+    for task_id, year, bits in rows:
+        done[task_id] = done.get(task_id, 0) | (to_int(bits) << _year_offset(year, first_year))
+    return done, first_year, last_year
+
+def all_required_bits(due, done):
+    """Days on which at least one required task was due and every one due was completed"""
+    any_due = missed = 0
+    for task_id, due_bits in due.items():
+        any_due |= due_bits
+        missed |= due_bits & ~done.get(task_id, 0)
+    return any_due & ~missed
+
+def streak_bits(session, child_id):
+    """(bitmap, first day) of the days that count for a child's streak.
+
+    As in the ledger, a day counts when the child completed a required daily
+    task on a day a required daily task was due.
+    """
+    done, first_year, last_year = _done_bits(session, child_id, categories=('DAILY',))
+    if not done:
+        return 0, date(first_year, 1, 1)
+    due = _due_bits(session, first_year, last_year, ('DAILY',))
+
+    completed = any_due = 0
+    for bits in done.values():
+        completed |= bits
+    for bits in due.values():
+        any_due |= bits
+    return completed & any_due, date(first_year, 1, 1)
+
+def child_calendar(session, child, year, today):
+    """Completions per day, "all required done" days and streaks for one child and year"""
+    from streaks import current_streak  # streaks builds on this module
+
+    child_id = child.id
+    days_in_year = 366 if calendar.isleap(year) else 365
+    done, _, _ = _done_bits(session, child_id, year, year)
+
+    counts = [0] * days_in_year
+    for bits in done.values():
+        while bits:
+            lowest = bits & -bits
+            counts[lowest.bit_length() - 1] += 1
+            bits ^= lowest
+
+    all_required = all_required_bits(_due_bits(session, year, year, ('DAILY', 'WEEKLY')), done)
+    return {
+        'child_id': child_id,
+        'year': year,
+        'start_date': date(year, 1, 1).isoformat(),
+        'counts': counts,
+        'all_required_done': ''.join('1' if all_required >> day & 1 else '0' for day in range(days_in_year)),
+        'all_required_days': bin(all_required).count('1'),
+        'current_streak': current_streak(child.streak_count, child.last_completion_date, today),
+        'longest_streak': child.longest_streak or 0
+    }
@@ -0,0 +1,53 @@
+"""Close finished weeks for every household, sharded across workers.
+
+Each household's week ends at midnight on Sunday in its own timezone, so a
+scheduled run closes the week before the current local one for each
+household, in a session and transaction of its own. Households that were
+already closed are skipped, so runs can repeat (e.g. hourly) and pick up
+households as their Monday arrives. Large instances split the households
+between workers by id:
+
+    python close_weeks.py                        # every household
+    python close_weeks.py --shard 0 --shards 4   # households with id % 4 == 0
+"""
+import argparse
+from datetime import timedelta
+
+from models import create_database, household_session, Household
+from services import close_week_for_all_children, get_week_start_date, household_today
+
+def shard_household_ids(session, shard=0, shards=1):
+    """Ids of the households in one shard"""
+    return [household_id for (household_id,) in session.query(Household.id).filter(
+        Household.id % shards == shard
+    ).order_by(Household.id)]
+
+def close_household_week(Session, household_id):
+    """Close the household's previous local week; returns the per-child results"""
+    session = household_session(Session, household_id)
+    try:
+        week_start = get_week_start_date(household_today(session)) - timedelta(days=7)
+        return close_week_for_all_children(session, week_start)
+    finally:
+        session.close()
+
+def close_weeks(Session, shard=0, shards=1):
+    """Close the previous week for every household in a shard; returns {household_id: results}"""
+    with Session() as session:
+        household_ids = shard_household_ids(session, shard, shards)
+    return {household_id: close_household_week(Session, household_id) for household_id in household_ids}
+
+def main():
+    parser = argparse.ArgumentParser(description="Close last week for each household and record payouts")
+    parser.add_argument('--shard', type=int, default=0, help="this worker's shard number")
+    parser.add_argument('--shards', type=int, default=1, help="number of workers sharing the households")
+    args = parser.parse_args()
+    if not 0 <= args.shard < args.shards:
+        parser.error("--shard must be between 0 and --shards - 1")
+
+    engine, Session = create_database()
+    for household_id, results in close_weeks(Session, args.shard, args.shards).items():
+        print(f"Household {household_id}: closed for {len(results)} child(ren)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Cached template fragments for the dashboards.
+
+Templates wrap data-dependent sections in a call block:
+
+    {% call cached_fragment('parent-tasks', versions.household, versions.catalog) %}...{% endcall %}
+
+The body is rendered once per name and key, and reused until the key changes.
+Keys are the household plus versions from the change log: the latest change
+to the task catalog, or to one child's row. So a fragment is re-rendered only
+after the data it shows has changed. Values that change without a write (a
+child's current streak lapses as the days pass) go into the key themselves.
+"""
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import case, func
+
+from models import ChangeLog, session_household_id
+
+# Rendered fragments kept per process (least recently used are dropped)
+FRAGMENT_CACHE_SIZE = 256
+
+class FragmentCache:
+    """Small thread-safe LRU cache of rendered HTML"""
+
+    def __init__(self, max_entries=FRAGMENT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            html = self._entries.get(key)
+            if html is not None:
+                self._entries.move_to_end(key)
+            return html
+
+    def set(self, key, html):
+        with self._lock:
+            self._entries[key] = html
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+fragment_cache = FragmentCache()
+
+def cached_fragment(name, *key, caller):
+    """Jinja call block: render the body once per (name, key) and reuse it"""
+    cache_key = (name,) + key
+    html = fragment_cache.get(cache_key)
+    if html is None:
+        html = caller()
+        fragment_cache.set(cache_key, html)
+    return html
+
+def dashboard_versions(session, child_ids=()):
+    """Change log versions in one query: {'household': id, 'catalog': n, 'children': {child_id: n}}"""
+    child_ids = list(child_ids)
+    row_key = case((ChangeLog.table_name == 'children', ChangeLog.row_id), else_=0)
+    filters = ChangeLog.table_name == 'tasks'
+    if child_ids:
+        filters = filters | ((ChangeLog.table_name == 'children') & ChangeLog.row_id.in_(child_ids))
+
+    rows = session.query(ChangeLog.table_name, row_key, func.max(ChangeLog.id)).filter(
+        filters
+    ).group_by(ChangeLog.table_name, row_key).all()
+
+    versions = {'household': session_household_id(session), 'catalog': 0, 'children': {child_id: 0 for child_id in child_ids}}
+    for table_name, row_id, version in rows:
+        if table_name == 'tasks':
+            versions['catalog'] = version
+        else:
+            versions['children'][row_id] = version
+    return versions
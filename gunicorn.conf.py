@@ -0,0 +1,27 @@
+"""Gunicorn settings for Chore Champions.
+
+    gunicorn 'main:create_app()'
+
+The app is loaded once in the master (preload_app), which also creates and
+upgrades the schema, seeds the default household and expands task
+occurrences before any worker is forked. Workers then start without
+touching the database and share the loaded code copy-on-write. Each worker
+drops the inherited connection pool so no connection is shared across
+processes.
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+preload_app = True
+
+def on_starting(server):
+    """Runs once in the master, before forking"""
+    import main
+    main.prepare_database()
+    main.dispose_engines()
+
+def post_fork(server, worker):
+    """Runs in each new worker"""
+    import main
+    main.dispose_engines(close=False)
@@ -0,0 +1,55 @@
+"""Create and list households on a shared instance.
+
+Each household has its own children, tasks, settings (PIN, timezone, payout
+rules) and history. A browser picks its household by visiting /h/<slug>.
+
+    python households.py list
+    python households.py create "The Smiths" smiths --pin 4321 --timezone Europe/Dublin \
+        --child "Ada,🦉,violet" --child "Tom,🐢,emerald"
+"""
+import argparse
+
+from models import create_database, Child, Household
+from services import create_household
+
+def parse_child(value):
+    """'Name,emoji,color' -> (name, avatar, color)"""
+    parts = [part.strip() for part in value.split(',')]
+    if len(parts) != 3 or not all(parts):
+        raise argparse.ArgumentTypeError("children are given as 'Name,emoji,color'")
+    return tuple(parts)
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage households")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help="show every household")
+    create = commands.add_parser('create', help="add a household with its settings and children")
+    create.add_argument('name')
+    create.add_argument('slug')
+    create.add_argument('--pin', default='1234', help="parent PIN")
+    create.add_argument('--timezone', default='Europe/London')
+    create.add_argument('--child', type=parse_child, action='append', default=[], help="'Name,emoji,color' (repeatable)")
+    args = parser.parse_args()
+
+    engine, Session = create_database()
+    session = Session()
+    try:
+        if args.command == 'list':
+            for household in session.query(Household).order_by(Household.id):
+                print(f"{household.id}\t{household.slug}\t{household.name}")
+            return
+
+        if session.query(Household).filter_by(slug=args.slug).first():
+            parser.error(f"a household with slug '{args.slug}' already exists")
+        household = create_household(session, args.name, args.slug, args.pin, args.timezone)
+        session.add_all([
+            Child(household_id=household.id, name=name, avatar=avatar, color=color, xp=0, level=1, streak_count=0)
+            for name, avatar, color in args.child
+        ])
+        session.commit()
+        print(f"Created household {household.id}: visit /h/{household.slug}")
+    finally:
+        session.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""Event-sourced completion ledger for children's derived stats.
+
+``Child.xp`` and ``level`` are a cache of the ledger: every completion,
+removal and week reset appends a ``ChildEvent``, and ``rebuild_child_stats``
+folds the events since the child's latest ``ChildSnapshot`` to refresh them.
+A new snapshot is written every SNAPSHOT_INTERVAL events, so a rebuild never
+replays more than that. Appending an event also updates the child's streak
+segments (see streaks.py), which keep ``streak_count``,
+``last_completion_date`` and ``longest_streak``.
+"""
+from calendar_bits import clear_completion_bits, set_completion_bit
+from models import Child, ChildEvent, ChildSnapshot, Task, TaskOccurrence
+from recurrence import ensure_occurrences
+from streaks import add_streak_day, close_streaks, ensure_streak_segments, remove_streak_day
+
+# Events folded before a new snapshot is written
+SNAPSHOT_INTERVAL = 50
+
+class LedgerState:
+    """XP for one child, folded from events"""
+
+    def __init__(self, xp=0):
+        self.xp = xp
+
+    def apply(self, event):
+        if event.kind == 'completion':
+            self.xp += event.points
+        elif event.kind == 'removal':
+            self.xp = max(0, self.xp - event.points)
+
+def counts_for_streak(session, task, completion_date):
+    """Whether a completion of this task on this day extends the streak"""
+    if task.category != 'DAILY' or not task.is_required:
+        return False
+    ensure_occurrences(session, completion_date)
+    return session.query(TaskOccurrence).join(Task, Task.id == TaskOccurrence.task_id).filter(
+        TaskOccurrence.due_date == completion_date,
+        Task.category == 'DAILY',
+        Task.is_required == True
+    ).first() is not None
+
+def _latest_snapshot(session, child):
+    """Newest snapshot for a child, creating a baseline from its stored xp if none exists.
+
+    The baseline keeps the child's current xp, so adopting the ledger does
+    not change anyone's stats.
+    """
+    snapshot = session.query(ChildSnapshot).filter(
+        ChildSnapshot.child_id == child.id
+    ).order_by(ChildSnapshot.event_id.desc()).first()
+    if snapshot is not None:
+        return snapshot
+
+    snapshot = ChildSnapshot(child_id=child.id, event_id=0, xp=child.xp or 0)
+    session.add(snapshot)
+    session.flush()
+    return snapshot
+
+def append_event(session, child, kind, completion=None, task=None, event_date=None):
+    """Append a completion/removal/reset event for a child (caller rebuilds and commits)"""
+    if kind == 'removal' and completion is not None and completion.approved is False:
+        return None  # still pending approval, so it never reached the ledger
+    _latest_snapshot(session, child)
+
+    event = ChildEvent(child_id=child.id, kind=kind, event_date=event_date)
+    if completion is not None:
+        event.completion_id = completion.id
+        event.event_date = completion.date
+        # A removal exactly reverses the completion event it undoes
+        original = None
+        if kind == 'removal':
+            original = session.query(ChildEvent).filter(
+                ChildEvent.child_id == child.id,
+                ChildEvent.kind == 'completion',
+                ChildEvent.completion_id == completion.id
+            ).order_by(ChildEvent.id.desc()).first()
+        if original is not None:
+            event.points = original.points
+            event.counts_for_streak = original.counts_for_streak
+        else:
+            event.points = task.points
+            event.counts_for_streak = counts_for_streak(session, task, completion.date)
+    session.add(event)
+    if completion is not None and kind == 'completion':
+        set_completion_bit(session, child.id, completion.task_id, completion.date)
+    elif completion is not None and kind == 'removal':
+        clear_completion_bits(session, completion.task_id, [completion])
+    session.flush()
+
+    if kind == 'completion' and event.counts_for_streak:
+        add_streak_day(session, child, event.event_date)
+    elif kind == 'removal' and event.counts_for_streak:
+        remove_streak_day(session, child, event.event_date)
+    elif kind == 'reset' and event.event_date is not None:
+        close_streaks(session, child, event.event_date)
+    return event
+
+def append_removals(session, task, completions):
+    """Append removal events for many completions of one task at once.
+
+    ``completions`` are rows with id, child_id, date and approved. Returns the
+    affected children; the caller deletes the completions, rebuilds and commits.
+    """
+    # Pending completions never reached the ledger
+    completions = [row for row in completions if row.approved]
+    child_ids = {row.child_id for row in completions}
+    children = session.query(Child).filter(Child.id.in_(child_ids)).all()
+    for child in children:
+        _latest_snapshot(session, child)
+
+    # Latest completion event per completion id (ids can be reused on SQLite)
+    originals = {}
+    for event in session.query(ChildEvent).filter(
+        ChildEvent.kind == 'completion',
+        ChildEvent.completion_id.in_([row.id for row in completions])
+    ).order_by(ChildEvent.id):
+        originals[(event.child_id, event.completion_id)] = event
+
+    streak_by_date = {}
+    events = []
+    for row in completions:
+        original = originals.get((row.child_id, row.id))
+        if original is not None:
+            points, streak = original.points, original.counts_for_streak
+        else:
+            # Completed before the ledger existed: its points are in the baseline
+            if row.date not in streak_by_date:
+                streak_by_date[row.date] = counts_for_streak(session, task, row.date)
+            points, streak = task.points, streak_by_date[row.date]
+        events.append(ChildEvent(
+            child_id=row.child_id, kind='removal', completion_id=row.id,
+            event_date=row.date, points=points, counts_for_streak=streak
+        ))
+    session.add_all(events)
+    clear_completion_bits(session, task.id, completions)
+    session.flush()
+
+    children_by_id = {child.id: child for child in children}
+    for child_id, day in sorted({(event.child_id, event.event_date) for event in events if event.counts_for_streak}):
+        remove_streak_day(session, children_by_id[child_id], day)
+    return children
+
+def rebuild_child_stats(session, child):
+    """Refresh a child's stats from its latest snapshot plus the events after it"""
+    snapshot = _latest_snapshot(session, child)
+    state = LedgerState(snapshot.xp)
+
+    events = session.query(ChildEvent).filter(
+        ChildEvent.child_id == child.id,
+        ChildEvent.id > snapshot.event_id
+    ).order_by(ChildEvent.id).all()
+    for event in events:
+        state.apply(event)
+
+    child.xp = state.xp
+    child.level = child.current_level
+    ensure_streak_segments(session, child)
+
+    if len(events) >= SNAPSHOT_INTERVAL:
+        session.add(ChildSnapshot(
+            child_id=child.id,
+            event_id=events[-1].id,
+            xp=state.xp
+        ))
+
+    return state
+
+def rebuild_all_children(session):
+    """Rebuild every child's stats from the ledger; caller commits"""
+    for child in session.query(Child).all():
+        rebuild_child_stats(session, child)
@@ -0,0 +1,272 @@
+"""Morning-rush load test.
+
+Starts the app under gunicorn against a scratch database, then simulates
+kid tablets completing their tasks across a compressed morning window
+(with double taps and retries) while parents poll the dashboard endpoints.
+Reports throughput, latency percentiles, lock errors, and correctness
+checks: duplicate completions and XP/level/streak drift.
+
+    python loadtest.py                                    # SQLite, 20 tablets
+    python loadtest.py --tablets 60 --duration 120
+    python loadtest.py --database-url postgresql://localhost/chore_load
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+from sqlalchemy import func
+
+# Attempts per completion before a tablet gives up (the first try plus retries)
+MAX_ATTEMPTS = 3
+
+# Seconds to wait for gunicorn to accept connections
+STARTUP_TIMEOUT = 30
+
+AVATARS = ["🦊", "🐣", "🐼", "🐸", "🦁", "🐙", "🦄", "🐢"]
+COLORS = ["indigo", "emerald", "rose", "amber", "sky", "violet"]
+
+class Recorder:
+    """Thread-safe latency and outcome counters keyed by endpoint"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.lock_errors = 0
+        self.retries = 0
+        self.duplicates_sent = 0
+
+    def record(self, endpoint, status, elapsed, body=''):
+        with self.lock:
+            self.latencies[endpoint].append(elapsed)
+            self.statuses[endpoint][status] += 1
+            if 'locked' in body or 'could not serialize' in body or 'deadlock' in body:
+                self.lock_errors += 1
+
+    def count(self, attribute):
+        with self.lock:
+            setattr(self, attribute, getattr(self, attribute) + 1)
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def request(opener, recorder, endpoint, url, payload=None, form=None):
+    """Send one request, record it, and return (status, parsed JSON or None)"""
+    data, headers = None, {}
+    if payload is not None:
+        data = json.dumps(payload).encode()
+        headers['Content-Type'] = 'application/json'
+    elif form is not None:
+        data = urllib.parse.urlencode(form).encode()
+
+    started = time.perf_counter()
+    try:
+        with opener.open(urllib.request.Request(url, data=data, headers=headers), timeout=30) as response:
+            status, body = response.status, response.read().decode()
+    except urllib.error.HTTPError as e:
+        status, body = e.code, e.read().decode(errors='replace')
+    except (urllib.error.URLError, OSError) as e:
+        status, body = 'error', str(e)
+    recorder.record(endpoint, status, time.perf_counter() - started, body)
+
+    try:
+        return status, json.loads(body)
+    except ValueError:
+        return status, None
+
+def tablet(base_url, child_id, deadline, args, recorder, rng):
+    """One kid's tablet: fetch today's tasks, then complete them across the window"""
+    opener = urllib.request.build_opener()
+    status, tasks = request(opener, recorder, 'GET /api/tasks/today', f"{base_url}/api/tasks/today?child_id={child_id}")
+    if status != 200 or not tasks:
+        return
+
+    todo = [task['id'] for task in tasks if not task['completed_today']]
+    rng.shuffle(todo)
+    window = max(0.0, deadline - time.time())
+    offsets = sorted(rng.uniform(0, window) for _ in todo)
+    started = time.time()
+
+    for task_id, offset in zip(todo, offsets):
+        time.sleep(max(0.0, started + offset - time.time()))
+        payload = {'child_id': child_id, 'task_id': task_id}
+        double_tap = None
+        if rng.random() < args.duplicate_rate:
+            # A double tap: both requests leave together and race each other
+            # past the server's already-completed check
+            recorder.count('duplicates_sent')
+            both_ready = threading.Barrier(2)
+
+            def second_tap():
+                both_ready.wait()
+                request(urllib.request.build_opener(), recorder, 'POST /api/completions',
+                        f"{base_url}/api/completions", payload)
+
+            double_tap = threading.Thread(target=second_tap)
+            double_tap.start()
+            both_ready.wait()
+        for attempt in range(MAX_ATTEMPTS):
+            if attempt:
+                recorder.count('retries')
+                time.sleep(rng.uniform(0.05, 0.5))
+            status, _ = request(opener, recorder, 'POST /api/completions', f"{base_url}/api/completions", payload)
+            # Retry what a flaky tablet would: server errors and dropped connections
+            if status == 'error' or (isinstance(status, int) and status >= 500):
+                continue
+            break
+        if double_tap is not None:
+            double_tap.join()
+
+def parent(base_url, pin, deadline, args, recorder):
+    """A parent dashboard polling children and recent completions"""
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    request(opener, recorder, 'POST /parent/login', f"{base_url}/parent/login", form={'pin': pin})
+    while time.time() < deadline:
+        request(opener, recorder, 'GET /api/children', f"{base_url}/api/children")
+        request(opener, recorder, 'GET /api/completions/recent', f"{base_url}/api/completions/recent")
+        time.sleep(args.poll_interval)
+
+def prepare_database(database_url, tablets, fresh):
+    """Create and seed the schema, with at least one child per tablet; returns (child ids, parent pin)"""
+    os.environ['DATABASE_URL'] = database_url
+    from models import Base, Child, create_database, get_or_create_settings
+
+    engine, Session = create_database()
+    if fresh:
+        Base.metadata.drop_all(engine)
+        engine, Session = create_database()
+
+    import main
+    main.prepare_database()
+
+    session = Session()
+    try:
+        existing = session.query(func.count(Child.id)).scalar()
+        for n in range(existing, tablets):
+            session.add(Child(
+                name=f"Kid {n + 1}",
+                avatar=AVATARS[n % len(AVATARS)],
+                color=COLORS[n % len(COLORS)],
+                xp=0, level=1, streak_count=0
+            ))
+        session.commit()
+        child_ids = [child_id for (child_id,) in session.query(Child.id).order_by(Child.id).limit(tablets)]
+        return child_ids, get_or_create_settings(session).parent_pin
+    finally:
+        session.close()
+        engine.dispose()
+
+def start_server(database_url, port, workers):
+    env = dict(os.environ, DATABASE_URL=database_url)
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-w', str(workers), '-b', f'127.0.0.1:{port}',
+         '--log-level', 'warning', 'main:create_app()'],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env
+    )
+    deadline = time.time() + STARTUP_TIMEOUT
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/api/settings', timeout=2).read()
+            return server
+        except (urllib.error.URLError, OSError):
+            if server.poll() is not None:
+                raise RuntimeError("gunicorn exited during startup")
+            time.sleep(0.25)
+    server.terminate()
+    raise RuntimeError("gunicorn did not start in time")
+
+def check_correctness(database_url):
+    """Duplicate completions (same child, task and day) and stat drift after the run"""
+    os.environ['DATABASE_URL'] = database_url
+    from models import TaskCompletion, create_database
+    from stats_check import check_child_stats
+
+    engine, Session = create_database()
+    session = Session()
+    try:
+        duplicates = session.query(
+            TaskCompletion.child_id, TaskCompletion.task_id, TaskCompletion.date
+        ).group_by(
+            TaskCompletion.child_id, TaskCompletion.task_id, TaskCompletion.date
+        ).having(func.count(TaskCompletion.id) > 1).count()
+        completions = session.query(func.count(TaskCompletion.id)).scalar()
+        return completions, duplicates, check_child_stats(session)
+    finally:
+        session.close()
+        engine.dispose()
+
+def report(recorder, elapsed, completions, duplicates, drift):
+    total = sum(len(v) for v in recorder.latencies.values())
+    print(f"\n{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s)\n")
+    print(f"{'endpoint':<32}{'count':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}  statuses")
+    for endpoint in sorted(recorder.latencies):
+        values = recorder.latencies[endpoint]
+        statuses = ', '.join(f"{k}={v}" for k, v in sorted(recorder.statuses[endpoint].items(), key=str))
+        print(f"{endpoint:<32}{len(values):>7}"
+              f"{percentile(values, 50) * 1000:>9.1f}{percentile(values, 95) * 1000:>9.1f}"
+              f"{percentile(values, 99) * 1000:>9.1f}  {statuses}")
+
+    print(f"\nRetries: {recorder.retries}   Duplicate taps sent: {recorder.duplicates_sent}   "
+          f"Lock errors: {recorder.lock_errors}")
+    print(f"Completions stored: {completions}   Duplicate completions: {duplicates}   "
+          f"Stat drift: {len(drift)} field(s)")
+    for issue in drift:
+        print(f"  {issue['child_name']}: {issue['field']} stored={issue['stored']} expected={issue['expected']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Morning-rush load test against gunicorn")
+    parser.add_argument('--database-url', default='sqlite:////tmp/chore_champions_load.db')
+    parser.add_argument('--keep', action='store_true', help="reuse the existing database instead of starting fresh")
+    parser.add_argument('--tablets', type=int, default=20, help="kid tablets (one child each)")
+    parser.add_argument('--parents', type=int, default=2, help="parent dashboards polling")
+    parser.add_argument('--duration', type=float, default=60, help="seconds the 30-minute morning window is compressed into")
+    parser.add_argument('--poll-interval', type=float, default=2.0, help="seconds between parent polls")
+    parser.add_argument('--duplicate-rate', type=float, default=0.1, help="chance a completion is sent twice at once")
+    parser.add_argument('--workers', type=int, default=4, help="gunicorn worker processes")
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--seed', type=int, help="random seed for a repeatable run")
+    args = parser.parse_args()
+
+    child_ids, pin = prepare_database(args.database_url, args.tablets, fresh=not args.keep)
+    server = start_server(args.database_url, args.port, args.workers)
+    base_url = f'http://127.0.0.1:{args.port}'
+    recorder = Recorder()
+    rng = random.Random(args.seed)
+
+    try:
+        started = time.time()
+        deadline = started + args.duration
+        threads = [
+            threading.Thread(target=tablet, args=(base_url, child_id, deadline, args, recorder, random.Random(rng.random())))
+            for child_id in child_ids
+        ] + [
+            threading.Thread(target=parent, args=(base_url, pin, deadline, args, recorder))
+            for _ in range(args.parents)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - started
+    finally:
+        server.terminate()
+        server.wait()
+
+    report(recorder, elapsed, *check_correctness(args.database_url))
+
+if __name__ == '__main__':
+    main()
@@ -1,34 +1,126 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Blueprint, Flask, current_app, render_template, request, jsonify, session, redirect, url_for, send_from_directory
 from flask_cors import CORS
-from datetime import datetime, date, timedelta
+from datetime import timedelta
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 from decimal import Decimal
 import pytz
+import hmac
 import json
 import os
+import threading
+import time
 
 from models import (
-    create_database, get_or_create_settings,
-    Child, Task, TaskCompletion, Badge, WeekSummary, Settings
+    create_database, get_or_create_settings, household_session, household_ids, DEFAULT_HOUSEHOLD_ID,
+    READ_METHODS, READ_YOUR_WRITES_SECONDS,
+    Household, Child, Task, TaskCompletion, Badge, WeekSummary, Settings, log_changes
 )
 from services import (
-    calculate_level, update_child_level, check_and_award_badges,
-    update_streak, calculate_weekly_payout, get_week_start_date,
-    close_week_for_all_children, get_random_praise
+    calculate_level, calculate_weekly_payout, get_week_start_date,
+    close_week_for_all_children, record_completion,
+    replay_completions, household_local_time, household_today,
+    approve_completions, reject_completions
 )
+from sync import get_changes_since
+from serializers import ChildWeekDTO, TaskDTO, DueTaskDTO, RecentCompletionDTO, json_response, html_json
+from fragments import cached_fragment, dashboard_versions
+from profiling import profiler
+from ledger import append_event, rebuild_child_stats
+from stats_check import check_child_stats
+from calendar_bits import child_calendar
+from streaks import build_missing_streak_segments
+from recurrence import (
+    validate_recurrence, validate_term_dates, refresh_task_occurrences, refresh_term_time_occurrences,
+    ensure_occurrences, archive_task
+)
+
+bp = Blueprint('main', __name__)
+
+# Engine and session factory, created on first use (see get_session_factory)
+engine = None
+Session = None
+_database_lock = threading.Lock()
+
+def create_app():
+    """Application factory. The database is not touched until the first request."""
+    app = Flask(__name__)
+    app.secret_key = os.environ.get('SESSION_SECRET', 'chore-champions-secret-key')
+    CORS(app)
+    app.jinja_env.globals['cached_fragment'] = cached_fragment
+    app.register_blueprint(bp)
+    profiler.init_app(app)
+    return app
+
+def get_session_factory():
+    """Create the engine and session factory (and check the schema) once, on first use.
+
+    Under gunicorn.conf.py this already happened in the master before
+    forking, so workers inherit them and skip the schema check.
+    """
+    global engine, Session
+    if Session is None:
+        with _database_lock:
+            if Session is None:
+                new_engine, new_session = create_database()
+                profiler.watch_engines(new_engine, new_session.kw['replica'])
+                engine, Session = new_engine, new_session
+    return Session
+
+def dispose_engines(close=True):
+    """Drop pooled connections; close=False in a forked child leaves the parent's open"""
+    if Session is not None:
+        for pooled in (engine, Session.kw['replica']):
+            if pooled is not None:
+                pooled.dispose(close=close)
+
+def prepare_database():
+    """Create and upgrade the schema, seed the default household and build missing streak segments.
+
+    Run once, before forking. Expanding each household's task occurrences up
+    to today also marks this process's occurrence horizon as fresh, so forked
+    workers skip that check until the next day.
+    """
+    factory = get_session_factory()
+    init_seed_data()
+    with factory() as session_db:
+        households = household_ids(session_db)
+    for household_id in households:
+        session_db = household_session(factory, household_id)
+        try:
+            ensure_occurrences(session_db, household_today(session_db))
+            if build_missing_streak_segments(session_db):
+                session_db.commit()
+        finally:
+            session_db.close()
 
-app = Flask(__name__)
-app.secret_key = os.environ.get('SESSION_SECRET', 'chore-champions-secret-key')
-CORS(app)
+def current_household_id():
+    """Household chosen on this browser via /h/<slug> (the default household otherwise)"""
+    return session.get('household_id', DEFAULT_HOUSEHOLD_ID)
 
-# Initialize database
-engine, Session = create_database()
+def is_instance_admin():
+    """Whether the request carries the instance operator's token (household parent PINs never do)"""
+    expected = os.environ.get('INSTANCE_ADMIN_TOKEN')
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(expected) and hmac.compare_digest(token.encode(), expected.encode())
 
 def get_session():
-    return Session()
+    """Session for this request: reads go to the replica unless this client just wrote"""
+    read_replica = request.method in READ_METHODS and time.time() >= session.get('primary_until', 0)
+    return household_session(get_session_factory(), current_household_id(), read_replica)
+
+@bp.after_app_request
+def read_own_writes(response):
+    """Keep a client on the primary for a few seconds after it writes"""
+    if Session is None or Session.kw['replica'] is None:
+        return response
+    if request.method not in READ_METHODS and response.status_code < 400:
+        session['primary_until'] = time.time() + READ_YOUR_WRITES_SECONDS
+    return response
 
 def init_seed_data():
-    """Initialize seed data if database is empty"""
-    session = get_session()
+    """Initialize seed data for the default household if it is empty"""
+    session = household_session(get_session_factory(), DEFAULT_HOUSEHOLD_ID)
     try:
         # Check if children already exist
         if session.query(Child).count() > 0:
@@ -129,37 +221,91 @@ def init_seed_data():
         session.close()
 
 # Routes
-@app.route('/')
+@bp.route('/')
 def index():
     """Login page with parent and child selection"""
     return render_template('index.html')
 
-@app.route('/kid/<int:child_id>')
+@bp.route('/h/<slug>')
+def select_household(slug):
+    """Switch this browser to a household (parents must log in again)"""
+    session_db = get_session_factory()()
+    try:
+        household = session_db.query(Household).filter_by(slug=slug).first()
+        if not household:
+            return redirect(url_for('.index'))
+        if household.id != current_household_id():
+            session.pop('is_parent', None)
+        session['household_id'] = household.id
+        return redirect(url_for('.index'))
+    finally:
+        session_db.close()
+
+@bp.route('/sw.js')
+def service_worker():
+    """Offline service worker, served from the root so it can control every page"""
+    response = send_from_directory(current_app.static_folder, 'sw.js')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@bp.route('/kid/<int:child_id>')
 def kid_dashboard(child_id):
     """Child dashboard with today's quests and progress"""
     session_db = get_session()
     try:
-        child = session_db.query(Child).get(child_id)
+        today = household_today(session_db)
+        children = ChildWeekDTO.fetch(session_db, get_week_start_date(today), today)
+        child = next((c for c in children if c.id == child_id), None)
         if not child:
-            return redirect(url_for('index'))
+            return redirect(url_for('.index'))
         
         # Get sibling for comparison
-        sibling = session_db.query(Child).filter(Child.id != child_id).first()
+        sibling = next((c for c in children if c.id != child_id), None)
         
-        return render_template('kid_dashboard.html', child=child, sibling=sibling)
+        # Ship the first render's data with the page instead of separate fetches
+        ensure_occurrences(session_db, today)
+        initial_state = {
+            'tasks': DueTaskDTO.fetch(session_db, child_id, today),
+            'children': children
+        }
+        versions = dashboard_versions(session_db, [c.id for c in children])
+        
+        return render_template(
+            'kid_dashboard.html', child=child, sibling=sibling,
+            initial_state=html_json(initial_state), versions=versions
+        )
     finally:
         session_db.close()
 
-@app.route('/parent')
+@bp.route('/parent')
 def parent_dashboard():
     """Parent admin dashboard"""
     # Simple PIN check
     if not session.get('is_parent'):
-        return redirect(url_for('parent_login'))
+        return redirect(url_for('.parent_login'))
     
-    return render_template('parent_dashboard.html')
+    session_db = get_session()
+    try:
+        today = household_today(session_db)
+        settings = get_or_create_settings(session_db)
+        pending = RecentCompletionDTO.fetch(session_db, None, False)
+        initial_state = {
+            'children': ChildWeekDTO.fetch(session_db, get_week_start_date(today), today),
+            'settings': {'full_payout_amount': settings.full_payout_amount},
+            'recent': RecentCompletionDTO.fetch(session_db, today - timedelta(days=7)),
+            'pending': {'completions': pending, 'total': len(pending)}
+        }
+        
+        # The task list is rendered server-side and cached per catalog version,
+        # so tasks are only queried when the catalog has changed
+        return render_template(
+            'parent_dashboard.html', initial_state=html_json(initial_state),
+            versions=dashboard_versions(session_db), tasks=lambda: TaskDTO.from_rows(session_db.execute(TaskDTO.select_active()))
+        )
+    finally:
+        session_db.close()
 
-@app.route('/parent/login', methods=['GET', 'POST'])
+@bp.route('/parent/login', methods=['GET', 'POST'])
 def parent_login():
     """Parent PIN verification"""
     if request.method == 'POST':
@@ -169,7 +315,7 @@ def parent_login():
             settings = get_or_create_settings(session_db)
             if pin == settings.parent_pin:
                 session['is_parent'] = True
-                return redirect(url_for('parent_dashboard'))
+                return redirect(url_for('.parent_dashboard'))
             else:
                 return render_template('parent_login.html', error="Invalid PIN")
         finally:
@@ -177,70 +323,63 @@ def parent_login():
     
     return render_template('parent_login.html')
 
-@app.route('/parent/logout')
+@bp.route('/parent/logout')
 def parent_logout():
     """Clear parent session"""
     session.pop('is_parent', None)
-    return redirect(url_for('index'))
+    return redirect(url_for('.index'))
 
 # API Routes
-@app.route('/api/children')
+@bp.route('/api/children')
 def api_children():
     """Get all children with weekly stats"""
     session_db = get_session()
     try:
-        children = session_db.query(Child).all()
-        week_start = get_week_start_date()
-        
-        result = []
-        for child in children:
-            # Calculate weekly stats
-            weekly_completions = session_db.query(TaskCompletion).filter(
-                TaskCompletion.child_id == child.id,
-                TaskCompletion.date >= week_start,
-                TaskCompletion.approved == True
-            ).all()
-            
-            weekly_points = sum(c.task.points for c in weekly_completions)
-            
-            result.append({
-                'id': child.id,
-                'name': child.name,
-                'avatar': child.avatar,
-                'color': child.color,
-                'xp': child.xp,
-                'level': child.current_level,
-                'streak_count': child.streak_count,
-                'weekly_points': weekly_points
-            })
+        today = household_today(session_db)
+        return json_response(ChildWeekDTO.fetch(session_db, get_week_start_date(today), today))
+    finally:
+        session_db.close()
+
+@bp.route('/api/children/<int:child_id>/calendar')
+def api_child_calendar(child_id):
+    """Get a child's completion heatmap, "all required done" days and streaks for a year"""
+    session_db = get_session()
+    try:
+        child = session_db.query(Child).get(child_id)
+        if not child:
+            return jsonify({'error': 'Child not found'}), 404
         
-        return jsonify(result)
+        today = household_today(session_db)
+        year = request.args.get('year', default=today.year, type=int)
+        if not 2000 <= year <= today.year + 1:
+            return jsonify({'error': 'year out of range'}), 400
+        
+        ensure_occurrences(session_db, today)
+        return json_response(child_calendar(session_db, child, year, today))
     finally:
         session_db.close()
 
-@app.route('/api/tasks')
+@bp.route('/api/tasks')
 def api_tasks():
     """Get all tasks"""
     session_db = get_session()
     try:
-        tasks = session_db.query(Task).all()
-        result = []
-        for task in tasks:
-            result.append({
-                'id': task.id,
-                'name': task.name,
-                'description': task.description,
-                'points': task.points,
-                'category': task.category,
-                'is_required': task.is_required,
-                'streakable': task.streakable,
-                'active_days': task.active_days
-            })
-        return jsonify(result)
+        return json_response(TaskDTO.from_rows(session_db.execute(TaskDTO.select_active())))
+    finally:
+        session_db.close()
+
+@bp.route('/api/sync')
+def api_sync():
+    """Get rows changed since a cursor (full snapshot when no cursor is given)"""
+    since = request.args.get('since', default=0, type=int)
+    
+    session_db = get_session()
+    try:
+        return json_response(get_changes_since(session_db, since))
     finally:
         session_db.close()
 
-@app.route('/api/tasks/today')
+@bp.route('/api/tasks/today')
 def api_tasks_today():
     """Get today's tasks for a specific child"""
     child_id = request.args.get('child_id', type=int)
@@ -249,39 +388,15 @@ def api_tasks_today():
     
     session_db = get_session()
     try:
-        today = date.today()
-        weekday = today.weekday()  # 0=Monday, 6=Sunday
-        
-        # Get tasks active today
-        tasks = session_db.query(Task).all()
-        today_tasks = [t for t in tasks if t.is_active_today(weekday)]
-        
-        # Check which tasks are already completed today
-        completed_today = session_db.query(TaskCompletion).filter(
-            TaskCompletion.child_id == child_id,
-            TaskCompletion.date == today,
-            TaskCompletion.approved == True
-        ).all()
-        
-        completed_task_ids = {c.task_id for c in completed_today}
-        
-        result = []
-        for task in today_tasks:
-            result.append({
-                'id': task.id,
-                'name': task.name,
-                'description': task.description,
-                'points': task.points,
-                'category': task.category,
-                'is_required': task.is_required,
-                'completed_today': task.id in completed_task_ids
-            })
+        today = household_today(session_db)
         
-        return jsonify(result)
+        # Tasks due today from the occurrence index, flagged if already done
+        ensure_occurrences(session_db, today)
+        return json_response(DueTaskDTO.fetch(session_db, child_id, today))
     finally:
         session_db.close()
 
-@app.route('/api/completions', methods=['POST'])
+@bp.route('/api/completions', methods=['POST'])
 def api_complete_task():
     """Complete a task for a child"""
     data = request.get_json()
@@ -296,10 +411,10 @@ def api_complete_task():
         child = session_db.query(Child).get(child_id)
         task = session_db.query(Task).get(task_id)
         
-        if not child or not task:
+        if not child or not task or task.archived_at is not None:
             return jsonify({'error': 'Child or task not found'}), 404
         
-        today = date.today()
+        timestamp, today, local_minute = household_local_time(session_db)
         
         # Check if already completed today
         existing = session_db.query(TaskCompletion).filter(
@@ -311,74 +426,68 @@ def api_complete_task():
         if existing:
             return jsonify({'error': 'Task already completed today'}), 400
         
-        # Create completion
-        completion = TaskCompletion(
-            child_id=child_id,
-            task_id=task_id,
-            date=today,
-            timestamp=datetime.utcnow()
-        )
-        session_db.add(completion)
-        
-        # Update child XP
-        child.xp += task.points
-        
-        # Update level
-        old_level = child.level
-        new_level = update_child_level(child)
-        level_up = new_level > old_level
-        
-        # Update streak
-        update_streak(session_db, child, today)
-        
-        session_db.commit()
-        
-        # Check for badges (after commit)
-        badges_earned = check_and_award_badges(session_db, child, task, today)
-        
-        # Get praise message
-        praise = get_random_praise()
-        
-        result = {
-            'success': True,
-            'praise': praise,
-            'xp_gained': task.points,
-            'total_xp': child.xp,
-            'level': child.level,
-            'level_up': level_up,
-            'streak_count': child.streak_count,
-            'badges_earned': badges_earned
-        }
+        result = record_completion(session_db, child, task, today, timestamp, local_minute)
         
         return jsonify(result)
         
+    except IntegrityError:
+        # A concurrent request completed it first
+        session_db.rollback()
+        return jsonify({'error': 'Task already completed today'}), 400
     except Exception as e:
         session_db.rollback()
         return jsonify({'error': str(e)}), 500
     finally:
         session_db.close()
 
-@app.route('/api/settings')
+@bp.route('/api/completions/bulk', methods=['POST'])
+def api_replay_completions():
+    """Replay completions queued by an offline tablet, keeping their original times"""
+    data = request.get_json() or {}
+    entries = data.get('completions')
+    
+    if not isinstance(entries, list):
+        return jsonify({'error': 'completions list required'}), 400
+    
+    session_db = get_session()
+    try:
+        results = replay_completions(session_db, entries)
+        return jsonify({'success': True, 'results': results})
+    except Exception as e:
+        session_db.rollback()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        session_db.close()
+
+@bp.route('/api/settings')
 def api_settings():
     """Get current settings"""
     session_db = get_session()
     try:
         settings = get_or_create_settings(session_db)
-        return jsonify({
-            'full_payout_amount': str(settings.full_payout_amount),
+        return json_response({
+            'full_payout_amount': settings.full_payout_amount,
             'threshold_rules': settings.get_threshold_rules(),
             'timezone': settings.timezone
         })
     finally:
         session_db.close()
 
-@app.route('/api/tasks', methods=['POST'])
+@bp.route('/api/tasks', methods=['POST'])
 def api_create_task():
     """Create a new task"""
     if not session.get('is_parent'):
         return jsonify({'error': 'Admin access required'}), 403
     
     data = request.get_json()
+    
+    recurrence = data.get('recurrence')
+    if recurrence is not None:
+        try:
+            validate_recurrence(recurrence)
+        except (ValueError, TypeError) as e:
+            return jsonify({'error': f'Invalid recurrence: {e}'}), 400
+    
     session_db = get_session()
     try:
         task = Task(
@@ -388,10 +497,14 @@ def api_create_task():
             category=data.get('category'),
             is_required=data.get('is_required', False),
             streakable=data.get('streakable', False),
-            active_days=data.get('active_days', [0, 1, 2, 3, 4, 5, 6])
+            requires_approval=data.get('requires_approval', False),
+            active_days=data.get('active_days', [0, 1, 2, 3, 4, 5, 6]),
+            recurrence=recurrence
         )
         
         session_db.add(task)
+        session_db.flush()
+        refresh_task_occurrences(session_db, task, start=household_today(session_db))
         session_db.commit()
         
         return jsonify({'success': True, 'task_id': task.id})
@@ -401,31 +514,31 @@ def api_create_task():
     finally:
         session_db.close()
 
-@app.route('/api/tasks/<int:task_id>', methods=['DELETE'])
+@bp.route('/api/tasks/<int:task_id>', methods=['DELETE'])
 def api_delete_task(task_id):
-    """Delete a task"""
+    """Archive a task (soft delete); ?purge=1 also queues its history for purge_tasks.py"""
     if not session.get('is_parent'):
         return jsonify({'error': 'Admin access required'}), 403
     
     session_db = get_session()
     try:
         task = session_db.query(Task).get(task_id)
-        if not task:
+        if not task or task.archived_at is not None:
             return jsonify({'error': 'Task not found'}), 404
         
-        # Delete associated completions first
-        session_db.query(TaskCompletion).filter(TaskCompletion.task_id == task_id).delete()
-        session_db.delete(task)
+        # Hidden and no longer due from today; completions and XP are untouched
+        archive_task(session_db, task, household_today(session_db))
+        task.purge_requested = request.args.get('purge', type=int) == 1
         session_db.commit()
         
-        return jsonify({'success': True})
+        return jsonify({'success': True, 'archived': True, 'purge_pending': task.purge_requested})
     except Exception as e:
         session_db.rollback()
         return jsonify({'error': str(e)}), 500
     finally:
         session_db.close()
 
-@app.route('/api/settings', methods=['PATCH'])
+@bp.route('/api/settings', methods=['PATCH'])
 def api_update_settings():
     """Update settings"""
     if not session.get('is_parent'):
@@ -445,6 +558,20 @@ def api_update_settings():
         if 'parent_pin' in data:
             settings.parent_pin = data['parent_pin']
         
+        if 'timezone' in data:
+            # Only affects completions written from now on; stored local dates are kept
+            if data['timezone'] not in pytz.all_timezones_set:
+                return jsonify({'error': 'Unknown timezone'}), 400
+            settings.timezone = data['timezone']
+        
+        if 'term_dates' in data:
+            try:
+                validate_term_dates(data['term_dates'])
+            except ValueError as e:
+                return jsonify({'error': f'Invalid term_dates: {e}'}), 400
+            settings.term_dates = data['term_dates']
+            refresh_term_time_occurrences(session_db)
+        
         session_db.commit()
         return jsonify({'success': True})
     except Exception as e:
@@ -453,7 +580,7 @@ def api_update_settings():
     finally:
         session_db.close()
 
-@app.route('/api/weeks/close', methods=['POST'])
+@bp.route('/api/weeks/close', methods=['POST'])
 def api_close_week():
     """Manually close the current week"""
     if not session.get('is_parent'):
@@ -472,7 +599,7 @@ def api_close_week():
     finally:
         session_db.close()
 
-@app.route('/api/weeks/reset', methods=['POST'])
+@bp.route('/api/weeks/reset', methods=['POST'])
 def reset_week():
     """Reset the current week - remove all completions and recalculate XP/levels"""
     if not session.get('is_parent'):
@@ -481,7 +608,7 @@ def reset_week():
     session_db = get_session()
     try:
         # Get current week start date
-        week_start = get_week_start_date()
+        week_start = get_week_start_date(household_today(session_db))
         
         # Get all completions from this week with proper joins
         this_week_completions = session_db.query(TaskCompletion).join(Task).filter(
@@ -491,29 +618,25 @@ def reset_week():
         # Track changes for each child
         results = []
         for child in session_db.query(Child).all():
-            # Calculate XP to remove for this child
             child_completions = [c for c in this_week_completions if c.child_id == child.id]
-            xp_to_remove = sum(c.task.points for c in child_completions)
-            
-            # Store original stats
+            original_xp = child.xp
             original_level = child.level
             
-            # Remove XP and recalculate level using proper service
-            child.xp = max(0, child.xp - xp_to_remove)
-            new_level = update_child_level(child)
-            
-            # Reset streak since we're clearing the week
-            child.streak_count = 0
-            child.last_completion_date = None
+            # Record removals and a streak reset in the ledger, then rebuild stats
+            for completion in child_completions:
+                append_event(session_db, child, 'removal', completion, completion.task)
+            append_event(session_db, child, 'reset', event_date=week_start)
+            rebuild_child_stats(session_db, child)
             
             results.append({
                 'child_name': child.name,
-                'xp_removed': xp_to_remove,
-                'new_level': new_level,
-                'level_changed': original_level != new_level
+                'xp_removed': original_xp - child.xp,
+                'new_level': child.level,
+                'level_changed': original_level != child.level
             })
         
         # Delete all completions from this week
+        log_changes(session_db, 'task_completions', [c.id for c in this_week_completions], 'delete')
         session_db.query(TaskCompletion).filter(
             TaskCompletion.date >= week_start
         ).delete()
@@ -532,7 +655,7 @@ def reset_week():
     finally:
         session_db.close()
 
-@app.route('/api/completions/recent')
+@bp.route('/api/completions/recent')
 def get_recent_completions():
     """Get recent completions from the last 7 days"""
     if not session.get('is_parent'):
@@ -540,38 +663,124 @@ def get_recent_completions():
     
     session_db = get_session()
     try:
-        uk_tz = pytz.timezone('Europe/London')
-        seven_days_ago = date.today() - timedelta(days=7)
-        
-        completions = session_db.query(TaskCompletion).join(Child).join(Task).filter(
-            TaskCompletion.date >= seven_days_ago,
-            TaskCompletion.approved == True
-        ).order_by(TaskCompletion.timestamp.desc()).all()
-        
-        completion_data = []
-        for completion in completions:
-            # Convert UTC timestamp to UK timezone
-            completion_time = completion.timestamp.replace(tzinfo=pytz.UTC).astimezone(uk_tz)
-            completion_data.append({
-                'id': completion.id,
-                'child_id': completion.child_id,
-                'child_name': completion.child.name,
-                'child_avatar': completion.child.avatar,
-                'task_name': completion.task.name,
-                'points': completion.task.points,
-                'date': completion_time.strftime('%d %b'),
-                'time': completion_time.strftime('%H:%M'),
-                'day_name': completion_time.strftime('%A')
-            })
+        seven_days_ago = household_today(session_db) - timedelta(days=7)
         
-        return jsonify(completion_data)
+        return json_response(RecentCompletionDTO.fetch(session_db, seven_days_ago))
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
         session_db.close()
 
-@app.route('/api/completions/<int:completion_id>', methods=['DELETE'])
+@bp.route('/api/completions/pending')
+def get_pending_completions():
+    """Completions waiting for parent approval, with counts per child"""
+    if not session.get('is_parent'):
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    session_db = get_session()
+    try:
+        # The queue reads the (household, timestamp) partial index of pending rows, already newest first
+        pending = RecentCompletionDTO.fetch(session_db, None, False)
+        counts = dict(session_db.query(
+            TaskCompletion.child_id, func.count(TaskCompletion.id)
+        ).filter(TaskCompletion.approved == False).group_by(TaskCompletion.child_id).all())
+        
+        return json_response({
+            'completions': pending,
+            'counts': {str(child_id): count for child_id, count in counts.items()},
+            'total': sum(counts.values())
+        })
+    finally:
+        session_db.close()
+
+@bp.route('/api/completions/approve', methods=['POST'])
+def api_approve_completions():
+    """Approve pending completions in one batch and apply XP, streaks and badges"""
+    if not session.get('is_parent'):
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    data = request.get_json() or {}
+    completion_ids = data.get('completion_ids')
+    if not isinstance(completion_ids, list):
+        return jsonify({'error': 'completion_ids list required'}), 400
+    
+    session_db = get_session()
+    try:
+        results = approve_completions(session_db, completion_ids)
+        return jsonify({
+            'success': True,
+            'approved': sum(r['approved'] for r in results),
+            'results': results
+        })
+    except Exception as e:
+        session_db.rollback()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        session_db.close()
+
+@bp.route('/api/completions/reject', methods=['POST'])
+def api_reject_completions():
+    """Reject pending completions, removing them from the queue"""
+    if not session.get('is_parent'):
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    data = request.get_json() or {}
+    completion_ids = data.get('completion_ids')
+    if not isinstance(completion_ids, list):
+        return jsonify({'error': 'completion_ids list required'}), 400
+    
+    session_db = get_session()
+    try:
+        return jsonify({'success': True, 'rejected': reject_completions(session_db, completion_ids)})
+    except Exception as e:
+        session_db.rollback()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        session_db.close()
+
+@bp.route('/api/admin/profiling', methods=['GET'])
+def get_profiling():
+    """Profiling configuration and the slowest captured requests"""
+    if not is_instance_admin():
+        return jsonify({'error': 'Instance admin access required'}), 403
+    
+    return jsonify({'config': profiler.get_config(), 'captures': profiler.list_captures()})
+
+@bp.route('/api/admin/profiling', methods=['PATCH'])
+def update_profiling():
+    """Switch profiling on/off, set the sample rate or route, and how many captures to keep"""
+    if not is_instance_admin():
+        return jsonify({'error': 'Instance admin access required'}), 403
+    
+    data = request.get_json() or {}
+    changes = {k: data[k] for k in ('enabled', 'sample_rate', 'route', 'keep') if k in data}
+    try:
+        return jsonify({'success': True, 'config': profiler.set_config(**changes)})
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+
+@bp.route('/api/admin/profiling', methods=['DELETE'])
+def clear_profiling():
+    """Delete every stored capture"""
+    if not is_instance_admin():
+        return jsonify({'error': 'Instance admin access required'}), 403
+    
+    profiler.clear()
+    return jsonify({'success': True})
+
+@bp.route('/api/admin/profiling/<capture_id>.<any(json, prof):extension>')
+def download_profile(capture_id, extension):
+    """Download a capture: .json (request, SQL, summary) or .prof (raw cProfile stats)"""
+    if not is_instance_admin():
+        return jsonify({'error': 'Instance admin access required'}), 403
+    
+    path = profiler.capture_path(capture_id, extension)
+    if not path:
+        return jsonify({'error': 'Capture not found'}), 404
+    return send_from_directory(profiler.profile_dir, os.path.basename(path), as_attachment=True)
+
+@bp.route('/api/completions/<int:completion_id>', methods=['DELETE'])
 def delete_completion(completion_id):
     """Remove a specific task completion and recalculate child stats"""
     if not session.get('is_parent'):
@@ -586,44 +795,47 @@ def delete_completion(completion_id):
         
         # Get child and original stats
         child = completion.child
+        original_xp = child.xp
         original_level = child.level
-        points_to_remove = completion.task.points
-        
-        # Remove XP and recalculate level using proper service
-        child.xp = max(0, child.xp - points_to_remove)
-        new_level = update_child_level(child)
-        
-        # Check if we need to recalculate streaks
-        # If this was a streakable required task, we may need to update streak
-        completion_date = completion.date
-        if completion.task.streakable and completion.task.is_required:
-            # Find the most recent completion date after removing this one
-            remaining_completions = session_db.query(TaskCompletion).filter(
-                TaskCompletion.child_id == child.id,
-                TaskCompletion.id != completion_id,
-                TaskCompletion.approved == True
-            ).order_by(TaskCompletion.date.desc()).first()
-            
-            if remaining_completions:
-                child.last_completion_date = remaining_completions.date
-                # Recalculate streak from scratch
-                update_streak(session_db, child, remaining_completions.date)
-            else:
-                child.streak_count = 0
-                child.last_completion_date = None
+        
+        # Record the removal in the ledger and rebuild XP, level and streak
+        append_event(session_db, child, 'removal', completion, completion.task)
         
         # Delete the completion
         child_name = child.name
         session_db.delete(completion)
+        rebuild_child_stats(session_db, child)
         session_db.commit()
         
         return jsonify({
             'success': True,
             'message': f'Task completion removed successfully',
             'child_name': child_name,
-            'new_level': new_level,
-            'level_changed': original_level != new_level,
-            'xp_removed': points_to_remove
+            'new_level': child.level,
+            'level_changed': original_level != child.level,
+            'xp_removed': original_xp - child.xp
+        })
+        
+    except Exception as e:
+        session_db.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        session_db.close()
+
+@bp.route('/api/admin/consistency', methods=['GET', 'POST'])
+def stats_consistency():
+    """Check children's stats against their history; POST repairs any drift"""
+    if not session.get('is_parent'):
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    session_db = get_session()
+    try:
+        repair = request.method == 'POST'
+        discrepancies = check_child_stats(session_db, repair=repair)
+        return jsonify({
+            'success': True,
+            'repaired': repair and bool(discrepancies),
+            'discrepancies': discrepancies
         })
         
     except Exception as e:
@@ -633,8 +845,8 @@ def delete_completion(completion_id):
         session_db.close()
 
 if __name__ == '__main__':
-    # Initialize seed data on startup
-    init_seed_data()
+    # Create the schema and seed data on startup
+    prepare_database()
     
     # Run the app
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    create_app().run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
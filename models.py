@@ -1,13 +1,53 @@
 from datetime import datetime, date
 from decimal import Decimal
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Date, ForeignKey, Text, JSON, Numeric, Index
+from sqlalchemy import create_engine, event, func, make_url, inspect, literal, text, bindparam, Column, Integer, String, Boolean, DateTime, Date, ForeignKey, Text, JSON, Numeric, Index, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.orm import sessionmaker, relationship, declared_attr, with_loader_criteria, Session as OrmSession
 import json
+import os
 
 Base = declarative_base()
 
-class Child(Base):
+# Household that existing single-family data belongs to
+DEFAULT_HOUSEHOLD_ID = 1
+
+# Session.info key holding the household a session is scoped to
+HOUSEHOLD_KEY = 'household_id'
+
+# Session.info keys: reads may use the replica / this session has written
+READ_REPLICA_KEY = 'read_replica'
+WROTE_KEY = 'wrote'
+
+# Seconds a client keeps reading from the primary after a write, to cover replica lag
+READ_YOUR_WRITES_SECONDS = float(os.getenv('READ_YOUR_WRITES_SECONDS', '5'))
+
+# Methods served from the read replica (when one is configured)
+READ_METHODS = ('GET', 'HEAD')
+
+class Household(Base):
+    """A family; every other table is partitioned by household_id"""
+    __tablename__ = 'households'
+    
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100), nullable=False)
+    slug = Column(String(50), nullable=False, unique=True)  # /h/<slug> selects the household
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<Household {self.slug}>"
+
+class HouseholdScoped:
+    """Mixin for rows that belong to one household.
+
+    Queries in a session scoped to a household (see household_session) only
+    see that household's rows, and new rows are assigned to it.
+    """
+    @declared_attr
+    def household_id(cls):
+        return Column(Integer, ForeignKey('households.id'), nullable=False, default=DEFAULT_HOUSEHOLD_ID)
+
+class Child(HouseholdScoped, Base):
     __tablename__ = 'children'
     
     id = Column(Integer, primary_key=True)
@@ -18,12 +58,17 @@ class Child(Base):
     level = Column(Integer, default=1)
     streak_count = Column(Integer, default=0)
     last_completion_date = Column(Date)
+    longest_streak = Column(Integer)  # None until the child's streak segments are built
     
     # Relationships
     completions = relationship("TaskCompletion", back_populates="child")
     badges = relationship("Badge", back_populates="child")
     week_summaries = relationship("WeekSummary", back_populates="child")
     
+    __table_args__ = (
+        Index('idx_children_household', 'household_id', 'id'),
+    )
+    
     @property
     def current_level(self):
         return (self.xp // 50) + 1
@@ -31,7 +76,7 @@ class Child(Base):
     def __repr__(self):
         return f"<Child {self.name}>"
 
-class Task(Base):
+class Task(HouseholdScoped, Base):
     __tablename__ = 'tasks'
     
     id = Column(Integer, primary_key=True)
@@ -42,9 +87,32 @@ class Task(Base):
     is_required = Column(Boolean, default=False)
     streakable = Column(Boolean, default=False)
     active_days = Column(JSON)  # [0,1,2,3,4,5,6] for Mon-Sun
+    recurrence = Column(JSON)  # {"type": "interval", "every": 2, ...}; None = weekly on active_days
+    occurrences_until = Column(Date)  # last date expanded into task_occurrences
+    occurrences_from = Column(Date)  # first date expanded (None: unknown, for tasks indexed before it was tracked)
+    archived_at = Column(DateTime)  # soft-deleted: hidden and no longer due, history kept
+    purge_requested = Column(Boolean, default=False)  # purge_tasks.py deletes its history
+    requires_approval = Column(Boolean, default=False)  # completions wait for a parent to approve
     
     # Relationships
     completions = relationship("TaskCompletion", back_populates="task")
+    occurrences = relationship("TaskOccurrence", back_populates="task", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        Index('idx_tasks_household', 'household_id', 'archived_at'),
+    )
+    
+    def get_recurrence(self):
+        """Recurrence rule, falling back to a weekly rule on active_days"""
+        return Task.recurrence_rule(self.recurrence, self.active_days)
+    
+    @staticmethod
+    def recurrence_rule(recurrence, active_days):
+        """Recurrence rule from raw column values (for row queries without a Task)"""
+        if recurrence is not None:
+            return recurrence
+        days = active_days if active_days is not None else [0, 1, 2, 3, 4, 5, 6]
+        return {"type": "weekly", "days": days}
     
     def is_active_today(self, weekday):
         """Check if task is active for given weekday (0=Monday, 6=Sunday)"""
@@ -55,15 +123,34 @@ class Task(Base):
     def __repr__(self):
         return f"<Task {self.name}>"
 
-class TaskCompletion(Base):
+class TaskOccurrence(HouseholdScoped, Base):
+    """A date a task is due, expanded ahead of time from its recurrence rule"""
+    __tablename__ = 'task_occurrences'
+    
+    task_id = Column(Integer, ForeignKey('tasks.id'), primary_key=True)
+    due_date = Column(Date, primary_key=True)
+    
+    # Relationships
+    task = relationship("Task", back_populates="occurrences")
+    
+    # "What's due on date D" lookups
+    __table_args__ = (
+        Index('idx_occurrence_household_due', 'household_id', 'due_date', 'task_id'),
+    )
+    
+    def __repr__(self):
+        return f"<TaskOccurrence {self.task_id} on {self.due_date}>"
+
+class TaskCompletion(HouseholdScoped, Base):
     __tablename__ = 'task_completions'
     
     id = Column(Integer, primary_key=True)
     child_id = Column(Integer, ForeignKey('children.id'), nullable=False)
     task_id = Column(Integer, ForeignKey('tasks.id'), nullable=False)
-    timestamp = Column(DateTime, default=datetime.utcnow)
-    date = Column(Date, nullable=False)
-    approved = Column(Boolean, default=True)
+    timestamp = Column(DateTime, default=datetime.utcnow)  # naive UTC
+    date = Column(Date, nullable=False)  # household-local date, set at write time
+    local_minute = Column(Integer)  # household-local minute of day (0-1439), set at write time
+    approved = Column(Boolean, default=True)  # False while waiting in the parent approval queue
     
     # Relationships
     child = relationship("Child", back_populates="completions")
@@ -71,14 +158,25 @@ class TaskCompletion(Base):
     
     # Indexes for performance
     __table_args__ = (
-        Index('idx_child_date', 'child_id', 'date'),
-        Index('idx_task_date', 'task_id', 'date'),
+        Index('idx_household_child_date', 'household_id', 'child_id', 'date'),
+        Index('idx_household_task_date', 'household_id', 'task_id', 'date'),
+        Index('idx_household_child_date_minute', 'household_id', 'child_id', 'date', 'local_minute'),
+        Index('idx_household_completion_date', 'household_id', 'date'),
+        # A task is completed at most once per child per day; concurrent
+        # submissions (e.g. a replayed offline queue) lose on this key
+        Index('uq_household_child_task_date', 'household_id', 'child_id', 'task_id', 'date', unique=True),
+        # Only pending rows, so the approval queue stays cheap however long the history:
+        # newest first across all children, and per child
+        Index('idx_household_pending_by_time', 'household_id', 'timestamp',
+              sqlite_where=text('approved = 0'), postgresql_where=text('approved = false')),
+        Index('idx_household_pending_completions', 'household_id', 'child_id', 'timestamp',
+              sqlite_where=text('approved = 0'), postgresql_where=text('approved = false')),
     )
     
     def __repr__(self):
         return f"<TaskCompletion {self.child.name} - {self.task.name} on {self.date}>"
 
-class Badge(Base):
+class Badge(HouseholdScoped, Base):
     __tablename__ = 'badges'
     
     id = Column(Integer, primary_key=True)
@@ -91,10 +189,14 @@ class Badge(Base):
     # Relationships
     child = relationship("Child", back_populates="badges")
     
+    __table_args__ = (
+        Index('idx_badges_household_child', 'household_id', 'child_id', 'name'),
+    )
+    
     def __repr__(self):
         return f"<Badge {self.name} for {self.child.name}>"
 
-class WeekSummary(Base):
+class WeekSummary(HouseholdScoped, Base):
     __tablename__ = 'week_summaries'
     
     id = Column(Integer, primary_key=True)
@@ -107,17 +209,26 @@ class WeekSummary(Base):
     # Relationships
     child = relationship("Child", back_populates="week_summaries")
     
+    __table_args__ = (
+        Index('idx_week_summaries_household', 'household_id', 'week_start_date', 'child_id'),
+    )
+    
     def __repr__(self):
         return f"<WeekSummary {self.child.name} week of {self.week_start_date}>"
 
-class Settings(Base):
+class Settings(HouseholdScoped, Base):
     __tablename__ = 'settings'
     
-    id = Column(Integer, primary_key=True, default=1)
+    id = Column(Integer, primary_key=True)
     full_payout_amount = Column(Numeric(10, 2), default=Decimal('3.00'))
     threshold_rules = Column(JSON)  # [{"min_points": 40, "amount": 2.0}, ...]
     timezone = Column(String(50), default='Europe/London')
     parent_pin = Column(String(100), default='1234')
+    term_dates = Column(JSON)  # [{"start": "2025-09-03", "end": "2025-10-24"}, ...]
+    
+    __table_args__ = (
+        Index('idx_settings_household', 'household_id', unique=True),
+    )
     
     def get_threshold_rules(self):
         if self.threshold_rules is not None:
@@ -130,38 +241,476 @@ class Settings(Base):
     def __repr__(self):
         return f"<Settings>"
 
+class ChangeLog(HouseholdScoped, Base):
+    """Append-only log of row changes; its id is the delta-sync cursor."""
+    __tablename__ = 'change_log'
+    
+    id = Column(Integer, primary_key=True)
+    table_name = Column(String(50), nullable=False)
+    row_id = Column(Integer, nullable=False)
+    operation = Column(String(10), nullable=False)  # insert, update, delete
+    changed_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('idx_change_log_household', 'household_id', 'id'),
+        Index('idx_change_log_household_row', 'household_id', 'table_name', 'row_id'),
+    )
+    
+    def __repr__(self):
+        return f"<ChangeLog {self.id} {self.operation} {self.table_name}:{self.row_id}>"
+
+class ChildEvent(HouseholdScoped, Base):
+    """Append-only ledger entry that changes a child's derived stats"""
+    __tablename__ = 'child_events'
+    
+    id = Column(Integer, primary_key=True)
+    child_id = Column(Integer, ForeignKey('children.id'), nullable=False)
+    kind = Column(String(20), nullable=False)  # completion, removal, reset
+    completion_id = Column(Integer)  # not a foreign key: completions can be deleted
+    event_date = Column(Date)  # completion date (reset: first day cleared)
+    points = Column(Integer, default=0)
+    counts_for_streak = Column(Boolean, default=False)  # required daily task on a due day
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('idx_child_events_household_child', 'household_id', 'child_id', 'id'),
+        Index('idx_child_events_household_completion', 'household_id', 'completion_id'),
+    )
+    
+    def __repr__(self):
+        return f"<ChildEvent {self.id} {self.kind} child {self.child_id}>"
+
+class ChildSnapshot(HouseholdScoped, Base):
+    """Folded ledger state for a child up to and including event_id"""
+    __tablename__ = 'child_snapshots'
+    
+    id = Column(Integer, primary_key=True)
+    child_id = Column(Integer, ForeignKey('children.id'), nullable=False)
+    event_id = Column(Integer, nullable=False, default=0)
+    xp = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('idx_child_snapshots_household_child', 'household_id', 'child_id', 'event_id'),
+    )
+    
+    def __repr__(self):
+        return f"<ChildSnapshot child {self.child_id} at event {self.event_id}>"
+
+# Bytes in a one-year completion bitmap (366 days, bit 0 = 1 January)
+BITMAP_BYTES = 46
+
+class CompletionBitmap(HouseholdScoped, Base):
+    """Days in one year on which a child has an approved completion of a task"""
+    __tablename__ = 'completion_bitmaps'
+    
+    child_id = Column(Integer, ForeignKey('children.id'), primary_key=True)
+    task_id = Column(Integer, ForeignKey('tasks.id'), primary_key=True)
+    year = Column(Integer, primary_key=True)
+    bits = Column(LargeBinary, nullable=False)  # little-endian, bit n = day n of the year
+    
+    __table_args__ = (
+        Index('idx_bitmaps_household_child', 'household_id', 'child_id', 'year'),
+    )
+    
+    def __repr__(self):
+        return f"<CompletionBitmap child {self.child_id} task {self.task_id} {self.year}>"
+
+class StreakSegment(HouseholdScoped, Base):
+    """A run of consecutive streak days for a child"""
+    __tablename__ = 'streak_segments'
+    
+    id = Column(Integer, primary_key=True)
+    child_id = Column(Integer, ForeignKey('children.id'), nullable=False)
+    start_date = Column(Date, nullable=False)
+    end_date = Column(Date, nullable=False)
+    length = Column(Integer, nullable=False)  # days, end_date - start_date + 1
+    closed = Column(Boolean, default=False, nullable=False)  # ended by a week reset
+    
+    __table_args__ = (
+        Index('idx_segments_household_child_end', 'household_id', 'child_id', 'end_date'),
+        Index('idx_segments_household_child_length', 'household_id', 'child_id', 'length'),
+    )
+    
+    def __repr__(self):
+        return f"<StreakSegment child {self.child_id} {self.start_date}..{self.end_date}>"
+
+class BadgeBackfillCheckpoint(HouseholdScoped, Base):
+    """Progress of the badge backfill job for one child, so it can resume"""
+    __tablename__ = 'badge_backfill_checkpoints'
+    
+    child_id = Column(Integer, ForeignKey('children.id'), primary_key=True)
+    processed_through = Column(Date)  # last fully replayed completion date
+    state = Column(JSON)  # in-memory replay state at processed_through
+    finished = Column(Boolean, default=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('idx_backfill_checkpoints_household', 'household_id', 'child_id'),
+    )
+    
+    def __repr__(self):
+        return f"<BadgeBackfillCheckpoint child {self.child_id} through {self.processed_through}>"
+
+# Tables whose changes are exposed through /api/sync
+SYNCED_TABLES = ('children', 'tasks', 'task_completions', 'badges')
+
+def session_household_id(session):
+    """Household a session is scoped to (the default household if unscoped)"""
+    return session.info.get(HOUSEHOLD_KEY, DEFAULT_HOUSEHOLD_ID)
+
+def household_session(Session, household_id, read_replica=False):
+    """Open a session that only sees, and writes to, one household.
+
+    With read_replica, its reads go to the read engine if one is configured
+    (see RoutingSession).
+    """
+    return Session(info={HOUSEHOLD_KEY: household_id, READ_REPLICA_KEY: read_replica})
+
+def household_ids(session):
+    """Ids of every household, in order"""
+    return [household_id for (household_id,) in session.query(Household.id).order_by(Household.id)]
+
+@event.listens_for(OrmSession, 'do_orm_execute')
+def _scope_to_household(execute_state):
+    """Limit ORM selects, updates and deletes in a scoped session to its household"""
+    household_id = execute_state.session.info.get(HOUSEHOLD_KEY)
+    if household_id is None or execute_state.is_column_load or execute_state.is_relationship_load:
+        return
+    if execute_state.is_select or execute_state.is_update or execute_state.is_delete:
+        execute_state.statement = execute_state.statement.options(with_loader_criteria(
+            HouseholdScoped, lambda cls: cls.household_id == household_id, include_aliases=True
+        ))
+
+@event.listens_for(OrmSession, 'before_flush')
+def _assign_household(session, flush_context, instances):
+    """New rows belong to the session's household unless set explicitly"""
+    for obj in session.new:
+        if isinstance(obj, HouseholdScoped) and obj.household_id is None:
+            obj.household_id = session_household_id(session)
+
+def log_changes(session, table_name, row_ids, operation, household_id=None):
+    """Append change log entries for rows written outside the ORM unit of work (bulk deletes)"""
+    if household_id is None:
+        household_id = session_household_id(session)
+    rows = [
+        {'household_id': household_id, 'table_name': table_name, 'row_id': row_id,
+         'operation': operation, 'changed_at': datetime.utcnow()}
+        for row_id in row_ids
+    ]
+    if rows:
+        session.connection().execute(ChangeLog.__table__.insert(), rows)
+
+@event.listens_for(OrmSession, 'after_flush')
+def _record_flushed_changes(session, flush_context):
+    """Log every flushed insert/update/delete of a synced table"""
+    for objects, operation in (
+        (session.new, 'insert'),
+        (session.dirty, 'update'),
+        (session.deleted, 'delete')
+    ):
+        by_table = {}
+        for obj in objects:
+            table_name = getattr(obj, '__tablename__', None)
+            if table_name not in SYNCED_TABLES:
+                continue
+            if operation == 'update' and not session.is_modified(obj, include_collections=False):
+                continue
+            by_table.setdefault((table_name, obj.household_id), []).append(obj.id)
+        for (table_name, household_id), row_ids in by_table.items():
+            log_changes(session, table_name, row_ids, operation, household_id)
+
+class RoutingSession(OrmSession):
+    """Session that sends plain reads to a read replica when asked to.
+
+    Only sessions opened with ``info['read_replica']`` use the replica, and
+    only for SELECTs. Flushes, INSERT/UPDATE/DELETE, SELECT ... FOR UPDATE and
+    raw connection access go to the primary. Once a session has written, its
+    later reads go to the primary too, so it always reads its own writes.
+    """
+
+    def __init__(self, *args, replica=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.replica = replica
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.replica is None or not self.info.get(READ_REPLICA_KEY):
+            return super().get_bind(mapper, clause=clause, **kwargs)
+        if (
+            self._flushing
+            or clause is None
+            or isinstance(clause, UpdateBase)
+            or getattr(clause, '_for_update_arg', None) is not None
+        ):
+            self.info[WROTE_KEY] = True
+        if self.info.get(WROTE_KEY):
+            return super().get_bind(mapper, clause=clause, **kwargs)
+        return self.replica
+
 # Database setup functions
-# Database setup functions
-# Database setup functions
-def create_database():
-    """Create engine + session factory using Render's DATABASE_URL if present."""
+def get_database_url(env_var="DATABASE_URL", default="sqlite:///chore_champions.db"):
+    """Read DATABASE_URL (Render) or fall back to local SQLite for dev."""
     import os
 
-    # Read from env var; fall back to local SQLite for dev
-    db_url = os.getenv("DATABASE_URL", "sqlite:///chore_champions.db")
+    db_url = os.getenv(env_var, default)
+    if db_url is None:
+        return None
 
     # Normalize legacy 'postgres://' to 'postgresql+psycopg2://'
     if db_url.startswith("postgres://"):
         db_url = db_url.replace("postgres://", "postgresql+psycopg2://", 1)
 
-    engine = create_engine(
-        db_url,
-        future=True,
-        pool_pre_ping=True  # keeps connections healthy after idle/sleep
-    )
-    Session = sessionmaker(bind=engine, expire_on_commit=False)
+    return db_url
+
+def engine_options(db_url):
+    """Connection pool settings from the environment, for engines that pool connections.
+
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT (seconds to wait for a
+    connection) and DB_POOL_RECYCLE (seconds before a connection is replaced)
+    fall back to SQLAlchemy's defaults when unset.
+    """
+    import os
+
+    options = {'pool_pre_ping': True}  # keeps connections healthy after idle/sleep
+    url = make_url(db_url)
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        return options  # in-memory SQLite uses a single connection per thread
+    for env_var, option in (
+        ('DB_POOL_SIZE', 'pool_size'),
+        ('DB_MAX_OVERFLOW', 'max_overflow'),
+        ('DB_POOL_TIMEOUT', 'pool_timeout'),
+        ('DB_POOL_RECYCLE', 'pool_recycle'),
+    ):
+        value = os.getenv(env_var)
+        if value:
+            options[option] = int(value)
+    return options
+
+def create_database():
+    """Create engine + session factory using Render's DATABASE_URL if present.
+
+    If DATABASE_READ_URL is set (e.g. a read replica), sessions opened with
+    read_replica=True read from it; see RoutingSession. The read engine is
+    available as ``Session.kw['replica']``.
+    """
+    db_url = get_database_url()
+    engine = create_engine(db_url, future=True, **engine_options(db_url))
+
+    read_url = get_database_url("DATABASE_READ_URL", None)
+    replica = create_engine(read_url, future=True, **engine_options(read_url)) if read_url else None
+    Session = sessionmaker(bind=engine, class_=RoutingSession, replica=replica, expire_on_commit=False)
 
     # Create tables if they don't exist
     Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        upgrade_schema(conn)
+
+    return engine, Session
+
+def upgrade_schema(conn):
+    """Add columns and indexes introduced since an existing database was created.
+
+    create_all only creates missing tables; new columns are added as nullable
+    (with their scalar default, if any) so older databases keep working.
+    """
+    inspector = inspect(conn)
+    added = set()
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+
+        existing_columns = {c['name'] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=conn.dialect)}"
+            if column.default is not None and column.default.is_scalar:
+                default = literal(column.default.arg, column.type).compile(
+                    dialect=conn.dialect, compile_kwargs={"literal_binds": True}
+                )
+                ddl += f" DEFAULT {default}"
+            conn.execute(text(ddl))
+            added.add((table.name, column.name))
+
+        existing_indexes = {i['name'] for i in inspector.get_indexes(table.name)}
+        if table.name == 'task_completions' and 'uq_household_child_task_date' not in existing_indexes:
+            _remove_duplicate_completions(conn)
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(conn)
+
+    households = Household.__table__
+    if conn.execute(households.select().limit(1)).first() is None:
+        conn.execute(households.insert().values(name='Home', slug='home', created_at=datetime.utcnow()))
+    if ('settings', 'household_id') in added and conn.dialect.name == 'postgresql':
+        # Settings used to be written with an explicit id of 1
+        conn.execute(text("SELECT setval(pg_get_serial_sequence('settings', 'id'), (SELECT MAX(id) FROM settings))"))
+
+    if ('task_completions', 'local_minute') in added:
+        _backfill_local_minutes(conn)
+
+    bitmaps = CompletionBitmap.__table__
+    completions = TaskCompletion.__table__
+    if conn.execute(bitmaps.select().limit(1)).first() is None and conn.execute(
+        completions.select().where(completions.c.approved == True).limit(1)
+    ).first() is not None:
+        _backfill_completion_bitmaps(conn)
+
+def _remove_duplicate_completions(conn):
+    """Delete all but the first completion per child, task and day before the unique index.
+
+    The points of approved duplicates are taken back off the child (with a
+    removal event in its ledger); the kept completion still covers the day's
+    bitmap and streak.
+    """
+    completions = TaskCompletion.__table__
+    events = ChildEvent.__table__
+    snapshots = ChildSnapshot.__table__
+    children = Child.__table__
+    tasks = Task.__table__
+
+    keys = conn.execute(
+        completions.select()
+        .with_only_columns(completions.c.household_id, completions.c.child_id, completions.c.task_id, completions.c.date)
+        .group_by(completions.c.household_id, completions.c.child_id, completions.c.task_id, completions.c.date)
+        .having(func.count() > 1)
+    ).all()
+    if not keys:
+        return
+
+    now = datetime.utcnow()
+    removed_points = {}
+    for household_id, child_id, task_id, day in keys:
+        rows = conn.execute(
+            completions.select()
+            .with_only_columns(completions.c.id, completions.c.approved)
+            .where(completions.c.household_id == household_id, completions.c.child_id == child_id,
+                   completions.c.task_id == task_id, completions.c.date == day)
+            .order_by(completions.c.id)
+        ).all()
+        for completion_id, approved in rows[1:]:
+            if approved:
+                removed_points.setdefault(child_id, 0)
+                event = conn.execute(
+                    events.select()
+                    .with_only_columns(events.c.points, events.c.counts_for_streak)
+                    .where(events.c.completion_id == completion_id, events.c.kind == 'completion')
+                ).first()
+                points, counts_for_streak = event if event is not None else (
+                    conn.execute(tasks.select().with_only_columns(tasks.c.points).where(tasks.c.id == task_id)).scalar() or 0,
+                    False
+                )
+                # Before the ledger's baseline snapshot the stored xp is the
+                # baseline, so only the child's xp changes
+                if conn.execute(snapshots.select().where(snapshots.c.child_id == child_id).limit(1)).first() is not None:
+                    conn.execute(events.insert().values(
+                        household_id=household_id, child_id=child_id, kind='removal', completion_id=completion_id,
+                        event_date=day, points=points, counts_for_streak=counts_for_streak, created_at=now
+                    ))
+                removed_points[child_id] += points or 0
+            conn.execute(completions.delete().where(completions.c.id == completion_id))
+            conn.execute(ChangeLog.__table__.insert().values(
+                household_id=household_id, table_name='task_completions', row_id=completion_id,
+                operation='delete', changed_at=now
+            ))
+
+    for child_id, points in removed_points.items():
+        xp = conn.execute(children.select().with_only_columns(children.c.xp).where(children.c.id == child_id)).scalar() or 0
+        xp = max(xp - points, 0)
+        conn.execute(children.update().where(children.c.id == child_id).values(xp=xp, level=xp // 50 + 1))
+
+def _backfill_local_minutes(conn, batch_size=1000):
+    """Fill local_minute for completions written before it existed"""
+    import pytz
+
+    tz_name = conn.execute(text("SELECT timezone FROM settings WHERE id = 1")).scalar()
+    tz = pytz.timezone(tz_name or 'Europe/London')
+    completions = TaskCompletion.__table__
+
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            completions.select()
+            .with_only_columns(completions.c.id, completions.c.timestamp)
+            .where(completions.c.id > last_id, completions.c.timestamp != None)
+            .order_by(completions.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        updates = []
+        for completion_id, timestamp in rows:
+            local = pytz.UTC.localize(timestamp).astimezone(tz)
+            updates.append({'b_id': completion_id, 'b_minute': local.hour * 60 + local.minute})
+        conn.execute(
+            completions.update()
+            .where(completions.c.id == bindparam('b_id'))
+            .values(local_minute=bindparam('b_minute')),
+            updates
+        )
+        last_id = rows[-1][0]
+
+def _backfill_completion_bitmaps(conn, batch_size=1000):
+    """Build completion bitmaps from the approved completions written before they existed"""
+    completions = TaskCompletion.__table__
+    bits = {}
+    for household_id, child_id, task_id, day in conn.execute(
+        completions.select()
+        .with_only_columns(completions.c.household_id, completions.c.child_id, completions.c.task_id, completions.c.date)
+        .where(completions.c.approved == True, completions.c.date != None)
+    ):
+        key = (household_id, child_id, task_id, day.year)
+        bits[key] = bits.get(key, 0) | (1 << (day.timetuple().tm_yday - 1))
+
+    rows = [
+        {'household_id': household_id, 'child_id': child_id, 'task_id': task_id, 'year': year,
+         'bits': value.to_bytes(BITMAP_BYTES, 'little')}
+        for (household_id, child_id, task_id, year), value in bits.items()
+    ]
+    for start in range(0, len(rows), batch_size):
+        conn.execute(CompletionBitmap.__table__.insert(), rows[start:start + batch_size])
+
+def get_async_database_url(db_url=None):
+    """Map DATABASE_URL (or another database URL) onto its async driver (aiosqlite / asyncpg)."""
+    if db_url is None:
+        db_url = get_database_url()
+
+    if db_url.startswith("sqlite:"):
+        return db_url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    for prefix in ("postgresql+psycopg2://", "postgresql://"):
+        if db_url.startswith(prefix):
+            return db_url.replace(prefix, "postgresql+asyncpg://", 1)
+    return db_url
+
+def create_async_database():
+    """Create async engine + session factory for the ASGI API tier.
+
+    Tables are created by the caller on startup (``run_sync(create_all)``)
+    since that needs a running event loop.
+    """
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    db_url = get_async_database_url()
+    engine = create_async_engine(db_url, **engine_options(db_url))
+
+    read_url = get_database_url("DATABASE_READ_URL", None)
+    replica = None
+    if read_url:
+        read_url = get_async_database_url(read_url)
+        replica = create_async_engine(read_url, **engine_options(read_url)).sync_engine
+    Session = async_sessionmaker(
+        bind=engine, sync_session_class=RoutingSession, replica=replica, expire_on_commit=False
+    )
 
     return engine, Session
 
 def get_or_create_settings(session):
-    """Get settings or create default if none exist"""
-    settings = session.query(Settings).filter_by(id=1).first()
+    """Get the session's household settings, creating the defaults if none exist"""
+    household_id = session_household_id(session)
+    settings = session.query(Settings).filter_by(household_id=household_id).first()
     if not settings:
         settings = Settings(
-            id=1,
+            household_id=household_id,
             full_payout_amount=Decimal('3.00'),
             threshold_rules=[
                 {"min_points": 40, "amount": 2.0},
@@ -0,0 +1,242 @@
+"""On-demand request profiling with slow-request capture.
+
+When switched on by the instance operator (``/api/admin/profiling`` with the
+``X-Admin-Token`` header matching INSTANCE_ADMIN_TOKEN), a sampled share of
+requests, or every request to one route, runs under cProfile. The SQL
+statements each request issues are recorded through engine events. Only the
+slowest N captures are kept, in PROFILE_DIR, shared by every worker process:
+
+    <id>.json   request, timing, SQL statements and a top-functions summary
+    <id>.prof   raw cProfile stats (``python -m pstats <id>.prof``)
+
+The on/off configuration lives in the same directory, so each gunicorn worker
+picks up changes without a restart. With profiling off, a request pays only
+a cached file stat.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles'))
+
+# Slowest captures kept unless configured otherwise
+DEFAULT_KEEP = 20
+
+# Functions listed in each capture's summary
+SUMMARY_FUNCTIONS = 30
+
+# Longest SQL statement text and parameter repr stored per query
+MAX_STATEMENT_CHARS = 2000
+MAX_PARAMETERS_CHARS = 500
+
+DEFAULT_CONFIG = {'enabled': False, 'sample_rate': 0.0, 'route': None, 'keep': DEFAULT_KEEP}
+
+class RequestProfiler:
+    """Flask extension that profiles selected requests and keeps the slowest"""
+
+    def __init__(self, profile_dir=PROFILE_DIR):
+        self.profile_dir = profile_dir
+        self._config = dict(DEFAULT_CONFIG)
+        self._config_mtime = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app, *engines, skip_prefix='/api/admin/profiling'):
+        """Hook into the app and into each engine (engines created later use watch_engines)"""
+        self.skip_prefix = skip_prefix
+        app.before_request(self._start)
+        app.after_request(self._record_status)
+        app.teardown_request(self._finish)
+        self.watch_engines(*engines)
+
+    def watch_engines(self, *engines):
+        """Record the SQL each profiled request runs on these engines (None entries are skipped)"""
+        for engine in engines:
+            if engine is not None:
+                event.listen(engine, 'before_cursor_execute', self._before_sql)
+                event.listen(engine, 'after_cursor_execute', self._after_sql)
+
+    @property
+    def config_path(self):
+        return os.path.join(self.profile_dir, 'config.json')
+
+    def get_config(self):
+        """Current configuration, re-read only when the file has changed"""
+        try:
+            mtime = os.stat(self.config_path).st_mtime
+        except OSError:
+            return dict(DEFAULT_CONFIG)
+        with self._lock:
+            if mtime != self._config_mtime:
+                try:
+                    with open(self.config_path) as f:
+                        self._config = dict(DEFAULT_CONFIG, **json.load(f))
+                except (OSError, ValueError):
+                    self._config = dict(DEFAULT_CONFIG)
+                self._config_mtime = mtime
+            return dict(self._config)
+
+    def set_config(self, **changes):
+        """Validate and save configuration changes; raises ValueError"""
+        config = self.get_config()
+        if 'enabled' in changes:
+            config['enabled'] = bool(changes['enabled'])
+        if 'sample_rate' in changes:
+            rate = float(changes['sample_rate'])
+            if not 0 <= rate <= 1:
+                raise ValueError("sample_rate must be between 0 and 1")
+            config['sample_rate'] = rate
+        if 'route' in changes:
+            config['route'] = changes['route'] or None
+        if 'keep' in changes:
+            keep = int(changes['keep'])
+            if keep < 1:
+                raise ValueError("keep must be at least 1")
+            config['keep'] = keep
+
+        os.makedirs(self.profile_dir, exist_ok=True)
+        temp_path = f"{self.config_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(config, f)
+        os.replace(temp_path, self.config_path)
+        self.prune(config['keep'])
+        return config
+
+    def _selected(self, config):
+        if not config['enabled'] or request.path.startswith(self.skip_prefix):
+            return False
+        if config['route']:
+            # Endpoints match with or without their blueprint prefix
+            endpoint = request.endpoint or ''
+            return config['route'] in (endpoint, endpoint.rsplit('.', 1)[-1], request.path)
+        return random.random() < config['sample_rate']
+
+    def _start(self):
+        if not self._selected(self.get_config()):
+            return
+        g.profile_sql = []
+        g.profiler = cProfile.Profile()
+        try:
+            g.profiler.enable()
+        except ValueError:
+            g.profiler = None  # another profiler is already active in this process
+        g.profile_started = time.perf_counter()
+
+    def _record_status(self, response):
+        if 'profile_started' in g:
+            g.profile_status = response.status_code
+        return response
+
+    def _finish(self, exc=None):
+        if 'profile_started' not in g:
+            return
+        duration = time.perf_counter() - g.pop('profile_started')
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+        statements = g.pop('profile_sql', [])
+        try:
+            self._store(duration, profiler, statements, exc)
+        except OSError:
+            pass  # profiling must never break a request
+
+    def _before_sql(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'profile_sql' in g:
+            conn.info.setdefault('profile_query_start', []).append(time.perf_counter())
+
+    def _after_sql(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'profile_sql' in g and conn.info.get('profile_query_start'):
+            elapsed = time.perf_counter() - conn.info['profile_query_start'].pop()
+            g.profile_sql.append({
+                'statement': statement[:MAX_STATEMENT_CHARS],
+                'parameters': repr(parameters)[:MAX_PARAMETERS_CHARS],
+                'duration_ms': round(elapsed * 1000, 3)
+            })
+
+    def list_captures(self):
+        """Metadata (without SQL) of the stored captures, slowest first"""
+        captures = []
+        if not os.path.isdir(self.profile_dir):
+            return captures
+        for name in os.listdir(self.profile_dir):
+            if not name.endswith('.json') or name == 'config.json':
+                continue
+            try:
+                with open(os.path.join(self.profile_dir, name)) as f:
+                    capture = json.load(f)
+            except (OSError, ValueError):
+                continue
+            capture.pop('sql', None)
+            capture.pop('summary', None)
+            captures.append(capture)
+        captures.sort(key=lambda c: c['duration_ms'], reverse=True)
+        return captures
+
+    def capture_path(self, capture_id, extension):
+        """Path of a stored capture file, or None if the id is unknown"""
+        if len(capture_id) != 32 or any(c not in '0123456789abcdef' for c in capture_id):
+            return None  # capture ids are uuid4 hex
+        path = os.path.join(self.profile_dir, f"{capture_id}.{extension}")
+        return path if os.path.exists(path) else None
+
+    def prune(self, keep):
+        """Delete all but the ``keep`` slowest captures"""
+        for capture in self.list_captures()[keep:]:
+            self._delete(capture['id'])
+
+    def clear(self):
+        for capture in self.list_captures():
+            self._delete(capture['id'])
+
+    def _delete(self, capture_id):
+        for extension in ('json', 'prof'):
+            try:
+                os.remove(os.path.join(self.profile_dir, f"{capture_id}.{extension}"))
+            except OSError:
+                pass
+
+    def _store(self, duration, profiler, statements, exc):
+        keep = self.get_config()['keep']
+        captures = self.list_captures()
+        duration_ms = round(duration * 1000, 3)
+        if len(captures) >= keep and duration_ms <= captures[keep - 1]['duration_ms']:
+            return  # not among the slowest
+
+        os.makedirs(self.profile_dir, exist_ok=True)
+        capture_id = uuid.uuid4().hex
+        summary = None
+        if profiler is not None:
+            profiler.dump_stats(os.path.join(self.profile_dir, f"{capture_id}.prof"))
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(SUMMARY_FUNCTIONS)
+            summary = out.getvalue()
+
+        capture = {
+            'id': capture_id,
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'endpoint': request.endpoint,
+            'status': g.get('profile_status'),
+            'error': repr(exc) if exc is not None else None,
+            'started_at': datetime.utcnow().isoformat(),
+            'duration_ms': duration_ms,
+            'sql_count': len(statements),
+            'sql_ms': round(sum(s['duration_ms'] for s in statements), 3),
+            'has_profile': profiler is not None,
+            'sql': statements,
+            'summary': summary
+        }
+        with open(os.path.join(self.profile_dir, f"{capture_id}.json"), 'w') as f:
+            json.dump(capture, f)
+        self.prune(keep)
+
+profiler = RequestProfiler()
@@ -0,0 +1,94 @@
+"""Purge the history of archived tasks in small batches.
+
+Deleting a task in the parent dashboard archives it immediately. If a purge
+was requested, this worker later deletes the task's completions a batch at a
+time. Each batch appends ledger removals, rebuilds the affected children's XP,
+levels and streaks, and commits on its own. Write locks are therefore short,
+and kids' completions can interleave between batches. Once a task has no
+completions left, the task row and its occurrences are deleted.
+
+    python purge_tasks.py                      # purge everything pending, then exit
+    python purge_tasks.py --loop --pause 0.5   # keep running as a background worker
+"""
+import argparse
+import time
+
+from models import create_database, household_ids, household_session, log_changes, Task, TaskCompletion
+from ledger import append_removals, rebuild_child_stats
+
+# Completions deleted per transaction
+PURGE_BATCH_SIZE = 200
+
+# Seconds between batches, so other writers get the lock
+PURGE_PAUSE_SECONDS = 0.1
+
+# Seconds between checks for new work in --loop mode
+POLL_INTERVAL_SECONDS = 60
+
+def purge_batch(session, task, batch_size=PURGE_BATCH_SIZE):
+    """Delete up to batch_size of a task's completions, adjusting stats; returns how many"""
+    rows = session.query(
+        TaskCompletion.id, TaskCompletion.child_id, TaskCompletion.date, TaskCompletion.approved
+    ).filter(
+        TaskCompletion.task_id == task.id
+    ).order_by(TaskCompletion.id).limit(batch_size).all()
+    if not rows:
+        return 0
+
+    children = append_removals(session, task, rows)
+    completion_ids = [row.id for row in rows]
+    log_changes(session, 'task_completions', completion_ids, 'delete')
+    session.query(TaskCompletion).filter(
+        TaskCompletion.id.in_(completion_ids)
+    ).delete(synchronize_session=False)
+    for child in children:
+        rebuild_child_stats(session, child)
+    session.commit()
+    return len(rows)
+
+def purge_task(session, task, batch_size=PURGE_BATCH_SIZE, pause=PURGE_PAUSE_SECONDS):
+    """Purge one archived task's history, then the task itself; returns completions deleted"""
+    deleted = 0
+    while True:
+        count = purge_batch(session, task, batch_size)
+        if not count:
+            break
+        deleted += count
+        time.sleep(pause)
+
+    session.delete(task)
+    session.commit()
+    return deleted
+
+def purge_archived_tasks(session, batch_size=PURGE_BATCH_SIZE, pause=PURGE_PAUSE_SECONDS):
+    """Purge every archived task with a pending purge; returns {task_id: completions deleted}"""
+    tasks = session.query(Task).filter(
+        Task.archived_at != None,
+        Task.purge_requested == True
+    ).order_by(Task.archived_at).all()
+    return {task.id: purge_task(session, task, batch_size, pause) for task in tasks}
+
+def main():
+    parser = argparse.ArgumentParser(description="Purge archived tasks and their completions")
+    parser.add_argument('--batch-size', type=int, default=PURGE_BATCH_SIZE)
+    parser.add_argument('--pause', type=float, default=PURGE_PAUSE_SECONDS, help="seconds between batches")
+    parser.add_argument('--loop', action='store_true', help="keep polling for new purges")
+    args = parser.parse_args()
+
+    engine, Session = create_database()
+    while True:
+        with Session() as session:
+            households = household_ids(session)
+        for household_id in households:
+            session = household_session(Session, household_id)
+            try:
+                for task_id, deleted in purge_archived_tasks(session, args.batch_size, args.pause).items():
+                    print(f"Task {task_id}: purged with {deleted} completion(s)")
+            finally:
+                session.close()
+        if not args.loop:
+            break
+        time.sleep(POLL_INTERVAL_SECONDS)
+
+if __name__ == '__main__':
+    main()
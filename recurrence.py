@@ -0,0 +1,218 @@
+"""Task recurrence rules and the precomputed occurrence index.
+
+Rules are stored as JSON on ``Task.recurrence``:
+
+    {"type": "weekly", "days": [0, 2, 4]}                      # Mon/Wed/Fri
+    {"type": "interval", "every": 3, "start": "2025-01-06"}    # every 3 days
+    {"type": "monthly", "days": [1, 15, -1]}                   # -1 = last day
+    {"type": "once", "date": "2025-03-01"}                     # one-off
+
+Any rule may add ``"term_time_only": true`` to only fall inside the term
+dates configured in Settings. Rules are expanded into ``task_occurrences``
+ahead of time so routes only ask "what's due on date D".
+"""
+import calendar
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func
+
+from models import Task, TaskOccurrence, TaskCompletion, get_or_create_settings, session_household_id
+
+RECURRENCE_TYPES = ('weekly', 'interval', 'monthly', 'once')
+
+# How far ahead of today occurrences are kept expanded
+OCCURRENCE_HORIZON_DAYS = 120
+
+# household_id -> furthest date known to be expanded for every task, in this process
+_expanded_until = {}
+
+# household_id -> earliest date known to be expanded for every task, in this process
+_expanded_from = {}
+
+def validate_recurrence(rule):
+    """Raise ValueError if a recurrence rule is malformed"""
+    if not isinstance(rule, dict) or rule.get('type') not in RECURRENCE_TYPES:
+        raise ValueError(f"recurrence type must be one of {', '.join(RECURRENCE_TYPES)}")
+
+    rule_type = rule['type']
+    if rule_type == 'weekly':
+        days = rule.get('days')
+        if not isinstance(days, list) or not all(isinstance(d, int) and 0 <= d <= 6 for d in days):
+            raise ValueError("weekly recurrence needs days between 0 (Mon) and 6 (Sun)")
+    elif rule_type == 'interval':
+        if not isinstance(rule.get('every'), int) or rule['every'] < 1:
+            raise ValueError("interval recurrence needs 'every' of at least 1 day")
+        date.fromisoformat(rule.get('start', ''))
+    elif rule_type == 'monthly':
+        days = rule.get('days')
+        if not isinstance(days, list) or not all(isinstance(d, int) and (1 <= d <= 31 or d == -1) for d in days):
+            raise ValueError("monthly recurrence needs days between 1 and 31, or -1 for the last day")
+    elif rule_type == 'once':
+        date.fromisoformat(rule.get('date', ''))
+
+def validate_term_dates(term_dates):
+    """Raise ValueError unless term dates are a list of {"start", "end"} ISO dates (or None)"""
+    if term_dates is None:
+        return
+    if not isinstance(term_dates, list):
+        raise ValueError("term dates must be a list of terms")
+    for term in term_dates:
+        if not isinstance(term, dict) or not isinstance(term.get('start'), str) or not isinstance(term.get('end'), str):
+            raise ValueError("each term needs 'start' and 'end' dates")
+        if date.fromisoformat(term['end']) < date.fromisoformat(term['start']):
+            raise ValueError("a term cannot end before it starts")
+
+def _in_term(day, term_ranges):
+    return any(start <= day <= end for start, end in term_ranges)
+
+def parse_term_dates(term_dates):
+    """Turn Settings.term_dates JSON into (start, end) date tuples"""
+    return [
+        (date.fromisoformat(term['start']), date.fromisoformat(term['end']))
+        for term in (term_dates or [])
+    ]
+
+def is_due(rule, day, term_ranges=()):
+    """Evaluate a rule for one day (used only while expanding occurrences)"""
+    if rule.get('term_time_only') and not _in_term(day, term_ranges):
+        return False
+
+    rule_type = rule['type']
+    if rule_type == 'weekly':
+        return day.weekday() in rule['days']
+    if rule_type == 'interval':
+        offset = (day - date.fromisoformat(rule['start'])).days
+        return offset >= 0 and offset % rule['every'] == 0
+    if rule_type == 'monthly':
+        last_day = calendar.monthrange(day.year, day.month)[1]
+        return day.day in rule['days'] or (-1 in rule['days'] and day.day == last_day)
+    if rule_type == 'once':
+        return day == date.fromisoformat(rule['date'])
+    return False
+
+def expand_rule(rule, start, end, term_ranges=()):
+    """All due dates for a rule between start and end inclusive"""
+    days = []
+    day = start
+    while day <= end:
+        if is_due(rule, day, term_ranges):
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+def _today(session):
+    """Today in the household's timezone"""
+    from services import household_today  # services imports this module
+    return household_today(session)
+
+def _history_start(session, today):
+    """Earliest completion date, so history-based reports have occurrences"""
+    earliest = session.query(TaskCompletion.date).order_by(TaskCompletion.date).first()
+    return min(earliest[0], today) if earliest else today
+
+def refresh_task_occurrences(session, task, start=None, end=None, term_ranges=None):
+    """Re-expand a task's occurrences from ``start`` (default: the household's today) to ``end``.
+
+    Occurrences before ``start`` are kept, so editing a rule never rewrites
+    what was due in the past. Caller commits.
+    """
+    if term_ranges is None:
+        term_ranges = parse_term_dates(get_or_create_settings(session).term_dates)
+    if start is None or end is None:
+        today = _today(session)
+    if start is None:
+        start = today if task.occurrences_until else _history_start(session, today)
+    if end is None:
+        end = today + timedelta(days=OCCURRENCE_HORIZON_DAYS)
+
+    session.query(TaskOccurrence).filter(
+        TaskOccurrence.task_id == task.id,
+        TaskOccurrence.due_date >= start
+    ).delete(synchronize_session=False)
+
+    session.add_all([
+        TaskOccurrence(household_id=task.household_id, task_id=task.id, due_date=day)
+        for day in expand_rule(task.get_recurrence(), start, end, term_ranges)
+    ])
+    if task.occurrences_until is None:
+        task.occurrences_from = start
+    task.occurrences_until = end
+
+def refresh_term_time_occurrences(session):
+    """Re-expand term-time-only tasks after the term dates change. Caller commits."""
+    term_ranges = parse_term_dates(get_or_create_settings(session).term_dates)
+    for task in session.query(Task).filter(Task.archived_at == None).all():
+        if task.get_recurrence().get('term_time_only'):
+            refresh_task_occurrences(session, task, term_ranges=term_ranges)
+
+def ensure_occurrences(session, until):
+    """Make sure every task is expanded up to ``until`` (extends the horizon lazily)"""
+    household_id = session_household_id(session)
+    expanded_until = _expanded_until.get(household_id)
+    if expanded_until is not None and until <= expanded_until:
+        return
+
+    end = max(until, _today(session) + timedelta(days=OCCURRENCE_HORIZON_DAYS))
+    stale = session.query(Task).filter(
+        Task.archived_at == None,
+        (Task.occurrences_until == None) | (Task.occurrences_until < until)
+    ).all()
+
+    if stale:
+        term_ranges = parse_term_dates(get_or_create_settings(session).term_dates)
+        for task in stale:
+            start = task.occurrences_until + timedelta(days=1) if task.occurrences_until else None
+            refresh_task_occurrences(session, task, start=start, end=end, term_ranges=term_ranges)
+        session.commit()
+
+    _expanded_until[household_id] = until
+
+def ensure_occurrences_since(session, start):
+    """Make sure every task is also expanded back to ``start``.
+
+    The index begins when a task was first expanded, so reports and replays
+    over older weeks extend it backwards, once per task and start date.
+    """
+    household_id = session_household_id(session)
+    expanded_from = _expanded_from.get(household_id)
+    if expanded_from is not None and start >= expanded_from:
+        return
+
+    ensure_occurrences(session, start)
+    behind = session.query(Task).filter(
+        Task.occurrences_until != None,
+        (Task.occurrences_from == None) | (Task.occurrences_from > start)
+    ).all()
+
+    if behind:
+        term_ranges = parse_term_dates(get_or_create_settings(session).term_dates)
+        for task in behind:
+            first = task.occurrences_from
+            if first is None:
+                # Indexed before occurrences_from existed: the index starts at its earliest row
+                first = session.query(func.min(TaskOccurrence.due_date)).filter(
+                    TaskOccurrence.task_id == task.id
+                ).scalar() or task.occurrences_until + timedelta(days=1)
+            session.add_all([
+                TaskOccurrence(household_id=task.household_id, task_id=task.id, due_date=day)
+                for day in expand_rule(task.get_recurrence(), start, first - timedelta(days=1), term_ranges)
+            ])
+            task.occurrences_from = min(start, first)
+        session.commit()
+
+    _expanded_from[household_id] = start
+
+def due_tasks_query(session, day):
+    """Query for tasks due on ``day``, from the occurrence index"""
+    ensure_occurrences(session, day)
+    return session.query(Task).join(
+        TaskOccurrence, TaskOccurrence.task_id == Task.id
+    ).filter(TaskOccurrence.due_date == day, Task.archived_at == None)
+
+def archive_task(session, task, today):
+    """Soft-delete a task: drop its occurrences from ``today`` on, keep its history. Caller commits."""
+    task.archived_at = datetime.utcnow()
+    session.query(TaskOccurrence).filter(
+        TaskOccurrence.task_id == task.id,
+        TaskOccurrence.due_date >= today
+    ).delete(synchronize_session=False)
@@ -0,0 +1,210 @@
+"""Response DTOs and fast JSON encoding.
+
+Each DTO selects just the columns a response needs, so list endpoints build
+compact ``__slots__`` objects straight from result rows instead of hydrating
+ORM instances and copying attributes into dicts. ``dumps`` encodes DTOs,
+dates and Decimals directly, using orjson when it is installed.
+"""
+import json
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from flask import current_app
+from markupsafe import Markup
+from sqlalchemy import case, exists, func, select
+
+from models import Child, Task, TaskCompletion, TaskOccurrence, Badge, WeekSummary
+from services import format_local_minute
+
+try:
+    import orjson
+except ImportError:  # optional: fall back to the standard library encoder
+    orjson = None
+
+JSON_MIMETYPE = 'application/json'
+
+class RowDTO:
+    """Base DTO: ``columns`` are selected and assigned to ``__slots__`` in order"""
+    __slots__ = ()
+    model = None
+    columns = ()
+
+    @classmethod
+    def select(cls):
+        return select(*cls.columns)
+
+    @classmethod
+    def from_row(cls, row):
+        dto = cls.__new__(cls)
+        for name, value in zip(cls.__slots__, row):
+            setattr(dto, name, value)
+        return dto
+
+    @classmethod
+    def from_rows(cls, rows):
+        return [cls.from_row(row) for row in rows]
+
+    @classmethod
+    def fetch(cls, session, *args):
+        """Run ``select(*args)`` and build one DTO per row"""
+        return cls.from_rows(session.execute(cls.select(*args)))
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+class ChildDTO(RowDTO):
+    __slots__ = ('id', 'name', 'avatar', 'color', 'xp', 'level', 'streak_count', 'last_completion_date')
+    model = Child
+    columns = (
+        Child.id, Child.name, Child.avatar, Child.color, Child.xp, Child.level,
+        Child.streak_count, Child.last_completion_date
+    )
+
+class ChildWeekDTO(RowDTO):
+    """A child plus approved points earned since the start of the week.
+
+    ``streak_count`` is the current streak on ``today`` (0 once the latest
+    run has lapsed, as in streaks.current_streak).
+    """
+    __slots__ = ('id', 'name', 'avatar', 'color', 'xp', 'level', 'streak_count', 'weekly_points')
+    model = Child
+    columns = ChildDTO.columns[:-2]
+
+    @classmethod
+    def select(cls, week_start, today):
+        weekly = select(
+            TaskCompletion.child_id, func.sum(Task.points).label('points')
+        ).join(Task, Task.id == TaskCompletion.task_id).where(
+            TaskCompletion.date >= week_start,
+            TaskCompletion.approved == True
+        ).group_by(TaskCompletion.child_id).subquery()
+
+        streak = case(
+            (Child.last_completion_date >= today - timedelta(days=1), func.coalesce(Child.streak_count, 0)),
+            else_=0
+        )
+        return select(*cls.columns, streak, func.coalesce(weekly.c.points, 0)).outerjoin(
+            weekly, weekly.c.child_id == Child.id
+        ).order_by(Child.id)
+
+class TaskDTO(RowDTO):
+    __slots__ = ('id', 'name', 'description', 'points', 'category', 'is_required',
+                 'streakable', 'active_days', 'recurrence', 'archived_at', 'requires_approval')
+    model = Task
+    columns = (
+        Task.id, Task.name, Task.description, Task.points, Task.category, Task.is_required,
+        Task.streakable, Task.active_days, Task.recurrence, Task.archived_at, Task.requires_approval
+    )
+
+    @classmethod
+    def select_active(cls):
+        """Tasks that have not been archived"""
+        return cls.select().where(Task.archived_at == None)
+
+    @classmethod
+    def from_row(cls, row):
+        dto = super().from_row(row)
+        dto.recurrence = Task.recurrence_rule(dto.recurrence, dto.active_days)
+        return dto
+
+class DueTaskDTO(RowDTO):
+    """A task due on a day, flagged if the child already completed it or is awaiting approval"""
+    __slots__ = ('id', 'name', 'description', 'points', 'category', 'is_required',
+                 'completed_today', 'pending_approval')
+    model = Task
+    columns = TaskDTO.columns[:6]
+
+    @classmethod
+    def select(cls, child_id, day):
+        def done(approved):
+            return exists().where(
+                TaskCompletion.task_id == Task.id,
+                TaskCompletion.child_id == child_id,
+                TaskCompletion.date == day,
+                TaskCompletion.approved == approved
+            )
+        return select(*cls.columns, done(True), done(False)).join(
+            TaskOccurrence, TaskOccurrence.task_id == Task.id
+        ).where(TaskOccurrence.due_date == day, Task.archived_at == None)
+
+class CompletionDTO(RowDTO):
+    __slots__ = ('id', 'child_id', 'task_id', 'date', 'local_minute', 'timestamp', 'approved')
+    model = TaskCompletion
+    columns = (
+        TaskCompletion.id, TaskCompletion.child_id, TaskCompletion.task_id, TaskCompletion.date,
+        TaskCompletion.local_minute, TaskCompletion.timestamp, TaskCompletion.approved
+    )
+
+class RecentCompletionDTO(RowDTO):
+    """A completion with the child and task details the parent dashboard shows"""
+    __slots__ = ('id', 'child_id', 'child_name', 'child_avatar', 'task_name', 'points', 'date', 'local_minute')
+    model = TaskCompletion
+    columns = (
+        TaskCompletion.id, TaskCompletion.child_id, Child.name, Child.avatar, Task.name, Task.points,
+        TaskCompletion.date, TaskCompletion.local_minute
+    )
+
+    @classmethod
+    def select(cls, since_date=None, approved=True):
+        statement = select(*cls.columns).join(
+            Child, Child.id == TaskCompletion.child_id
+        ).join(
+            Task, Task.id == TaskCompletion.task_id
+        ).where(
+            TaskCompletion.approved == approved
+        ).order_by(TaskCompletion.timestamp.desc())
+        if since_date is not None:
+            statement = statement.where(TaskCompletion.date >= since_date)
+        return statement
+
+    def to_dict(self):
+        # Date and minute were stored in household time when written
+        return {
+            'id': self.id,
+            'child_id': self.child_id,
+            'child_name': self.child_name,
+            'child_avatar': self.child_avatar,
+            'task_name': self.task_name,
+            'points': self.points,
+            'date': self.date.strftime('%d %b'),
+            'time': format_local_minute(self.local_minute),
+            'day_name': self.date.strftime('%A')
+        }
+
+class BadgeDTO(RowDTO):
+    __slots__ = ('id', 'child_id', 'name', 'emoji', 'description', 'earned_date')
+    model = Badge
+    columns = (Badge.id, Badge.child_id, Badge.name, Badge.emoji, Badge.description, Badge.earned_date)
+
+class WeekSummaryDTO(RowDTO):
+    __slots__ = ('id', 'child_id', 'week_start_date', 'total_points', 'required_tasks_completed', 'payout_amount')
+    model = WeekSummary
+    columns = (
+        WeekSummary.id, WeekSummary.child_id, WeekSummary.week_start_date, WeekSummary.total_points,
+        WeekSummary.required_tasks_completed, WeekSummary.payout_amount
+    )
+
+def _default(value):
+    """Encode what the JSON encoders don't handle themselves"""
+    if isinstance(value, RowDTO):
+        return value.to_dict()
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def dumps(payload):
+    """Encode a payload (dicts, lists, DTOs, dates, Decimals) to JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default)
+    return json.dumps(payload, default=_default, separators=(',', ':'), ensure_ascii=False).encode()
+
+def json_response(payload, status=200):
+    """Flask response for a payload encoded with ``dumps``"""
+    return current_app.response_class(dumps(payload), status=status, mimetype=JSON_MIMETYPE)
+
+def html_json(payload):
+    """JSON safe to embed in a <script type="application/json"> block"""
+    text = dumps(payload).decode()
+    return Markup(text.replace('<', '\\u003c').replace('>', '\\u003e').replace('&', '\\u0026'))
@@ -1,7 +1,33 @@
-from datetime import datetime, date, timedelta
+from datetime import datetime, date, timedelta, timezone
 from decimal import Decimal
 import random
-from models import Task, TaskCompletion, Badge, WeekSummary, Settings, get_or_create_settings
+import pytz
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from models import Child, Task, TaskCompletion, TaskOccurrence, Badge, WeekSummary, Settings, Household, get_or_create_settings, log_changes
+from recurrence import due_tasks_query, ensure_occurrences, ensure_occurrences_since
+from ledger import append_event, rebuild_child_stats
+from streaks import current_streak
+
+# Offline completions older than this are not replayed
+MAX_BACKDATE_DAYS = 7
+
+# Tolerated drift between a tablet's clock and the server's
+MAX_CLOCK_SKEW_MINUTES = 5
+
+# Badge name -> (emoji, description)
+BADGE_DEFINITIONS = {
+    "Morning Hero": ("🥇", "Completed 3 tasks before 9 AM"),
+    "All-Green Day": ("💯", "Completed all required tasks for the day"),
+    "Streak Star": ("🌟", "Maintained a 5-day streak"),
+    "Tidy Master": ("🧹", "Completed 'Tidy Room' 10 times"),
+}
+
+# Badge thresholds
+MORNING_HERO_TASKS = 3
+MORNING_CUTOFF_HOUR = 9
+STREAK_STAR_DAYS = 5
+TIDY_MASTER_COUNT = 10
 
 # Praise messages for task completion
 PRAISE_MESSAGES = [
@@ -31,6 +57,27 @@ def update_child_level(child):
     child.level = new_level
     return new_level
 
+def household_timezone(session):
+    """The household's configured timezone"""
+    return pytz.timezone(get_or_create_settings(session).timezone or 'Europe/London')
+
+def household_local_time(session, timestamp=None):
+    """Naive UTC timestamp (default now) -> (timestamp, household-local date, minute of day)"""
+    if timestamp is None:
+        timestamp = datetime.utcnow()
+    local = pytz.UTC.localize(timestamp).astimezone(household_timezone(session))
+    return timestamp, local.date(), local.hour * 60 + local.minute
+
+def household_today(session):
+    """Today's date in the household's timezone"""
+    return household_local_time(session)[1]
+
+def format_local_minute(local_minute):
+    """Minute of day -> 'HH:MM' ('' if unknown)"""
+    if local_minute is None:
+        return ''
+    return f"{local_minute // 60:02d}:{local_minute % 60:02d}"
+
 def get_week_start_date(target_date=None):
     """Get the Monday of the current week"""
     if target_date is None:
@@ -41,87 +88,46 @@ def get_week_start_date(target_date=None):
     week_start = target_date - timedelta(days=days_since_monday)
     return week_start
 
-def update_streak(session, child, completion_date):
-    """Update child's streak based on task completion"""
-    # Get required daily tasks
-    weekday = completion_date.weekday()
-    required_daily_tasks = session.query(Task).filter(
-        Task.category == 'DAILY',
-        Task.is_required == True
-    ).all()
-    
-    # Filter tasks active today
-    active_required_tasks = [t for t in required_daily_tasks if t.is_active_today(weekday)]
-    
-    if not active_required_tasks:
-        # No required tasks today, don't update streak
-        return
+def make_badge(child_id, name, earned_date):
+    """Build a Badge row from its definition"""
+    emoji, description = BADGE_DEFINITIONS[name]
+    return Badge(
+        child_id=child_id,
+        name=name,
+        emoji=emoji,
+        description=description,
+        earned_date=earned_date
+    )
+
+def check_and_award_badges(session, child, task, completion_date):
+    """Check and award badges based on task completion"""
+    badges_earned = []
     
-    # Check if child completed at least one required task today
-    completed_today = session.query(TaskCompletion).filter(
+    # Check Morning Hero badge (3 tasks before 9 AM household time), using the
+    # stored local minute of the original completion times
+    morning_completions = session.query(TaskCompletion).filter(
         TaskCompletion.child_id == child.id,
         TaskCompletion.date == completion_date,
+        TaskCompletion.local_minute < MORNING_CUTOFF_HOUR * 60,
         TaskCompletion.approved == True
-    ).join(Task).filter(
-        Task.category == 'DAILY',
-        Task.is_required == True
     ).count()
     
-    if completed_today > 0:
-        # Check streak continuation
-        yesterday = completion_date - timedelta(days=1)
-        
-        # If this is the first completion or yesterday had completions, continue streak
-        if child.last_completion_date is None:
-            child.streak_count = 1
-        elif child.last_completion_date == yesterday:
-            child.streak_count += 1
-        elif child.last_completion_date < yesterday:
-            # Gap in streak, reset
-            child.streak_count = 1
-        # If last_completion_date is today, don't change streak (already counted)
-        
-        child.last_completion_date = completion_date
-
-def check_and_award_badges(session, child, task, completion_date):
-    """Check and award badges based on task completion"""
-    badges_earned = []
-    
-    # Check Morning Hero badge (3 tasks before 9 AM)
-    if completion_date == date.today():
-        morning_cutoff = datetime.combine(completion_date, datetime.min.time().replace(hour=9))
-        morning_completions = session.query(TaskCompletion).filter(
-            TaskCompletion.child_id == child.id,
-            TaskCompletion.date == completion_date,
-            TaskCompletion.timestamp < morning_cutoff,
-            TaskCompletion.approved == True
-        ).count()
-        
-        if morning_completions >= 3:
-            if not session.query(Badge).filter(
-                Badge.child_id == child.id,
-                Badge.name == "Morning Hero"
-            ).first():
-                badge = Badge(
-                    child_id=child.id,
-                    name="Morning Hero",
-                    emoji="🥇",
-                    description="Completed 3 tasks before 9 AM",
-                    earned_date=completion_date
-                )
-                session.add(badge)
-                badges_earned.append("Morning Hero 🥇")
+    if morning_completions >= MORNING_HERO_TASKS:
+        if not session.query(Badge).filter(
+            Badge.child_id == child.id,
+            Badge.name == "Morning Hero"
+        ).first():
+            badge = make_badge(child.id, "Morning Hero", completion_date)
+            session.add(badge)
+            badges_earned.append("Morning Hero 🥇")
     
     # Check All-Green Day badge (all required tasks for today)
-    weekday = completion_date.weekday()
-    required_tasks_today = session.query(Task).filter(
+    due_required_today = due_tasks_query(session, completion_date).filter(
         Task.category.in_(['DAILY', 'WEEKLY']),
         Task.is_required == True
-    ).all()
-    
-    active_required_today = [t for t in required_tasks_today if t.is_active_today(weekday)]
+    ).count()
     
-    if active_required_today:
+    if due_required_today:
         completed_required_today = session.query(TaskCompletion).filter(
             TaskCompletion.child_id == child.id,
             TaskCompletion.date == completion_date,
@@ -131,35 +137,23 @@ def check_and_award_badges(session, child, task, completion_date):
             Task.is_required == True
         ).count()
         
-        if completed_required_today >= len(active_required_today):
+        if completed_required_today >= due_required_today:
             if not session.query(Badge).filter(
                 Badge.child_id == child.id,
                 Badge.name == "All-Green Day",
                 Badge.earned_date == completion_date
             ).first():
-                badge = Badge(
-                    child_id=child.id,
-                    name="All-Green Day",
-                    emoji="💯",
-                    description="Completed all required tasks for the day",
-                    earned_date=completion_date
-                )
+                badge = make_badge(child.id, "All-Green Day", completion_date)
                 session.add(badge)
                 badges_earned.append("All-Green Day 💯")
     
-    # Check Streak Star badge (5 day streak)
-    if child.streak_count >= 5:
+    # Check Streak Star badge (5 day streak, still running on the completion's day)
+    if current_streak(child.streak_count, child.last_completion_date, completion_date) >= STREAK_STAR_DAYS:
         if not session.query(Badge).filter(
             Badge.child_id == child.id,
             Badge.name == "Streak Star"
         ).first():
-            badge = Badge(
-                child_id=child.id,
-                name="Streak Star",
-                emoji="🌟",
-                description="Maintained a 5-day streak",
-                earned_date=completion_date
-            )
+            badge = make_badge(child.id, "Streak Star", completion_date)
             session.add(badge)
             badges_earned.append("Streak Star 🌟")
     
@@ -172,24 +166,214 @@ def check_and_award_badges(session, child, task, completion_date):
             Task.name == "Tidy Room"
         ).count()
         
-        if tidy_count >= 10:
+        if tidy_count >= TIDY_MASTER_COUNT:
             if not session.query(Badge).filter(
                 Badge.child_id == child.id,
                 Badge.name == "Tidy Master"
             ).first():
-                badge = Badge(
-                    child_id=child.id,
-                    name="Tidy Master",
-                    emoji="🧹",
-                    description="Completed 'Tidy Room' 10 times",
-                    earned_date=completion_date
-                )
+                badge = make_badge(child.id, "Tidy Master", completion_date)
                 session.add(badge)
                 badges_earned.append("Tidy Master 🧹")
     
     session.commit()
     return badges_earned
 
+def record_completion(session, child, task, completion_date, timestamp=None, local_minute=None):
+    """Record a task completion and apply XP, level, streak and badge updates.
+
+    ``completion_date`` and ``local_minute`` are household-local (see
+    household_local_time). Shared by the Flask routes and the async API tier,
+    which calls it through ``AsyncSession.run_sync``.
+    """
+    if timestamp is None or local_minute is None:
+        timestamp, _, local_minute = household_local_time(session, timestamp)
+    completion = TaskCompletion(
+        child_id=child.id,
+        task_id=task.id,
+        date=completion_date,
+        timestamp=timestamp,
+        local_minute=local_minute,
+        approved=not task.requires_approval
+    )
+    session.add(completion)
+    session.flush()
+
+    if not completion.approved:
+        # Queued for a parent; XP, streak and badges apply on approval
+        session.commit()
+        return {
+            'success': True,
+            'pending_approval': True,
+            'praise': "Sent to a parent for approval! ⏳",
+            'completion_id': completion.id,
+            'xp_gained': 0,
+            'total_xp': child.xp,
+            'level': child.level,
+            'level_up': False,
+            'streak_count': current_streak(child.streak_count, child.last_completion_date, household_today(session)),
+            'badges_earned': []
+        }
+
+    # XP, level and streak are rebuilt from the ledger
+    old_level = child.level
+    append_event(session, child, 'completion', completion, task)
+    rebuild_child_stats(session, child)
+    level_up = child.level > old_level
+
+    session.commit()
+
+    # Check for badges (after commit)
+    badges_earned = check_and_award_badges(session, child, task, completion_date)
+
+    return {
+        'success': True,
+        'praise': get_random_praise(),
+        'completion_id': completion.id,
+        'xp_gained': task.points,
+        'total_xp': child.xp,
+        'level': child.level,
+        'level_up': level_up,
+        'streak_count': current_streak(child.streak_count, child.last_completion_date, household_today(session)),
+        'badges_earned': badges_earned
+    }
+
+def approve_completions(session, completion_ids):
+    """Approve pending completions in one batch.
+
+    Ledger events are appended in completion order, then each affected child
+    is rebuilt once and badges are checked once per child and day.
+    Returns per-child results.
+    """
+    pending = session.query(TaskCompletion).filter(
+        TaskCompletion.id.in_(completion_ids),
+        TaskCompletion.approved == False
+    ).order_by(TaskCompletion.timestamp, TaskCompletion.id).all()
+
+    children = {}
+    days = {}
+    for completion in pending:
+        completion.approved = True
+        child = children.setdefault(completion.child_id, completion.child)
+        append_event(session, child, 'completion', completion, completion.task)
+        # Badge checks look at the task only for Tidy Master, so keep a Tidy Room one if present
+        key = (child.id, completion.date)
+        if key not in days or completion.task.name == "Tidy Room":
+            days[key] = completion.task
+
+    today = household_today(session)
+    results = {}
+    for child in children.values():
+        old_xp, old_level = child.xp, child.level
+        rebuild_child_stats(session, child)
+        results[child.id] = {
+            'child_id': child.id,
+            'child_name': child.name,
+            'approved': sum(1 for c in pending if c.child_id == child.id),
+            'xp_gained': child.xp - old_xp,
+            'total_xp': child.xp,
+            'level': child.level,
+            'level_up': child.level > old_level,
+            'streak_count': current_streak(child.streak_count, child.last_completion_date, today),
+            'badges_earned': []
+        }
+    session.commit()
+
+    for (child_id, completion_date), task in sorted(days.items(), key=lambda item: item[0][1]):
+        results[child_id]['badges_earned'] += check_and_award_badges(
+            session, children[child_id], task, completion_date
+        )
+    return list(results.values())
+
+def reject_completions(session, completion_ids):
+    """Delete pending completions (they never reached the ledger); returns how many"""
+    ids = [completion_id for (completion_id,) in session.query(TaskCompletion.id).filter(
+        TaskCompletion.id.in_(completion_ids),
+        TaskCompletion.approved == False
+    )]
+    if ids:
+        log_changes(session, 'task_completions', ids, 'delete')
+        session.query(TaskCompletion).filter(TaskCompletion.id.in_(ids)).delete(synchronize_session=False)
+    session.commit()
+    return len(ids)
+
+def parse_completion_time(value):
+    """Parse an ISO 8601 client timestamp into naive UTC (naive input is taken as UTC)"""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def replay_completions(session, entries):
+    """Apply queued offline completions in their original time order.
+
+    Each entry is a dict with child_id, task_id, completed_at (ISO 8601) and an
+    optional client_ref echoed back in the result. Entries already recorded for
+    the same child, task and day (checked first, and enforced by the unique
+    index for concurrent replays) are reported as duplicates, so a client can
+    safely resend its whole queue.
+    """
+    now = datetime.utcnow()
+    results = []
+    parsed = []
+
+    for entry in entries:
+        client_ref = entry.get('client_ref')
+        try:
+            timestamp = parse_completion_time(entry['completed_at'])
+        except (KeyError, TypeError, ValueError):
+            results.append({'client_ref': client_ref, 'status': 'rejected', 'error': 'completed_at must be an ISO timestamp'})
+            continue
+
+        if timestamp > now + timedelta(minutes=MAX_CLOCK_SKEW_MINUTES):
+            results.append({'client_ref': client_ref, 'status': 'rejected', 'error': 'completed_at is in the future'})
+        elif timestamp < now - timedelta(days=MAX_BACKDATE_DAYS):
+            results.append({'client_ref': client_ref, 'status': 'rejected', 'error': 'completed_at is too old'})
+        else:
+            parsed.append((timestamp, entry))
+
+    parsed.sort(key=lambda item: item[0])
+
+    for timestamp, entry in parsed:
+        client_ref = entry.get('client_ref')
+        child = session.get(Child, entry.get('child_id'))
+        task = session.get(Task, entry.get('task_id'))
+        if not child or not task or task.archived_at is not None:
+            results.append({'client_ref': client_ref, 'status': 'rejected', 'error': 'Child or task not found'})
+            continue
+
+        # Bucket by the household-local day of the original time
+        _, completion_date, local_minute = household_local_time(session, timestamp)
+
+        existing = session.query(TaskCompletion).filter(
+            TaskCompletion.child_id == child.id,
+            TaskCompletion.task_id == task.id,
+            TaskCompletion.date == completion_date
+        ).first()
+        if existing:
+            results.append({'client_ref': client_ref, 'status': 'duplicate', 'completion_id': existing.id})
+            continue
+
+        try:
+            result = record_completion(session, child, task, completion_date, timestamp, local_minute)
+        except IntegrityError:
+            # A concurrent replay of the same queue recorded it first
+            session.rollback()
+            existing_id = session.query(TaskCompletion.id).filter(
+                TaskCompletion.child_id == entry.get('child_id'),
+                TaskCompletion.task_id == entry.get('task_id'),
+                TaskCompletion.date == completion_date
+            ).scalar()
+            results.append({'client_ref': client_ref, 'status': 'duplicate', 'completion_id': existing_id})
+            continue
+        results.append({
+            'client_ref': client_ref,
+            'status': 'created',
+            'completion_id': result['completion_id'],
+            'badges_earned': result['badges_earned']
+        })
+
+    return results
+
 def calculate_weekly_payout(session, child_id, week_start):
     """Calculate payout for a child for a specific week"""
     settings = get_or_create_settings(session)
@@ -206,32 +390,34 @@ def calculate_weekly_payout(session, child_id, week_start):
     # Calculate total points
     total_points = sum(c.task.points for c in completions)
     
-    # Check if all required tasks for the week are completed
-    required_tasks = session.query(Task).filter(
+    # Check if all required tasks for the week are completed: compare what
+    # was due each day (occurrence index) with what was done, in two grouped queries.
+    # The index may start after week_start (e.g. a household's first close), so extend it back.
+    ensure_occurrences(session, week_end)
+    ensure_occurrences_since(session, week_start)
+    due_by_day = dict(session.query(
+        TaskOccurrence.due_date, func.count(TaskOccurrence.task_id)
+    ).join(Task, Task.id == TaskOccurrence.task_id).filter(
+        TaskOccurrence.due_date >= week_start,
+        TaskOccurrence.due_date <= week_end,
         Task.is_required == True
-    ).all()
+    ).group_by(TaskOccurrence.due_date).all())
     
-    all_required_completed = True
-    for day_offset in range(7):
-        check_date = week_start + timedelta(days=day_offset)
-        weekday = check_date.weekday()
-        
-        # Get required tasks for this day
-        required_for_day = [t for t in required_tasks if t.is_active_today(weekday)]
-        
-        if required_for_day:
-            # Check if all required tasks for this day are completed
-            completed_for_day = session.query(TaskCompletion).filter(
-                TaskCompletion.child_id == child_id,
-                TaskCompletion.date == check_date,
-                TaskCompletion.approved == True
-            ).join(Task).filter(
-                Task.is_required == True
-            ).count()
-            
-            if completed_for_day < len(required_for_day):
-                all_required_completed = False
-                break
+    completed_by_day = dict(session.query(
+        TaskCompletion.date, func.count(TaskCompletion.id)
+    ).join(Task).filter(
+        TaskCompletion.child_id == child_id,
+        TaskCompletion.date >= week_start,
+        TaskCompletion.date <= week_end,
+        TaskCompletion.approved == True,
+        Task.is_required == True
+    ).group_by(TaskCompletion.date).all())
+    
+    # A week with nothing required due never earns the full amount
+    all_required_completed = bool(due_by_day) and all(
+        completed_by_day.get(day, 0) >= due_count
+        for day, due_count in due_by_day.items()
+    )
     
     # Calculate payout
     if all_required_completed:
@@ -254,11 +440,10 @@ def calculate_weekly_payout(session, child_id, week_start):
         'payout': payout
     }
 
-def close_week_for_all_children(session):
-    """Close the current week for all children and calculate payouts"""
-    from models import Child  # Import here to avoid circular imports
-    
-    week_start = get_week_start_date()
+def close_week_for_all_children(session, week_start=None):
+    """Close a week (default: the current one) for all children and calculate payouts"""
+    if week_start is None:
+        week_start = get_week_start_date(household_today(session))
     children = session.query(Child).all()
     results = []
     
@@ -295,4 +480,21 @@ def close_week_for_all_children(session):
         })
     
     session.commit()
-    return results
\ No newline at end of file
+    return results
+
+def create_household(session, name, slug, parent_pin='1234', timezone='Europe/London'):
+    """Create a household with its own default settings; caller commits"""
+    household = Household(name=name, slug=slug)
+    session.add(household)
+    session.flush()
+    session.add(Settings(
+        household_id=household.id,
+        full_payout_amount=Decimal('3.00'),
+        threshold_rules=[
+            {"min_points": 40, "amount": 2.0},
+            {"min_points": 25, "amount": 1.0}
+        ],
+        timezone=timezone,
+        parent_pin=parent_pin
+    ))
+    return household
@@ -0,0 +1,78 @@
+// Offline completion queue shared by the kid dashboard and the service worker.
+// Completions made without a connection are kept in IndexedDB with their
+// original time and replayed in one call to /api/completions/bulk.
+const OfflineQueue = (() => {
+    const DB_NAME = 'chore-champions';
+    const STORE = 'pendingCompletions';
+
+    function openDb() {
+        return new Promise((resolve, reject) => {
+            const request = indexedDB.open(DB_NAME, 1);
+            request.onupgradeneeded = () => {
+                request.result.createObjectStore(STORE, { keyPath: 'client_ref' });
+            };
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => reject(request.error);
+        });
+    }
+
+    async function withStore(mode, callback) {
+        const db = await openDb();
+        return new Promise((resolve, reject) => {
+            const tx = db.transaction(STORE, mode);
+            const result = callback(tx.objectStore(STORE));
+            tx.oncomplete = () => resolve(result && 'result' in result ? result.result : undefined);
+            tx.onerror = () => reject(tx.error);
+        });
+    }
+
+    function newClientRef() {
+        if (self.crypto && self.crypto.randomUUID) {
+            return self.crypto.randomUUID();
+        }
+        return `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+    }
+
+    async function add(childId, taskId) {
+        const entry = {
+            client_ref: newClientRef(),
+            child_id: childId,
+            task_id: taskId,
+            completed_at: new Date().toISOString()
+        };
+        await withStore('readwrite', store => store.put(entry));
+        return entry;
+    }
+
+    function all() {
+        return withStore('readonly', store => store.getAll());
+    }
+
+    function remove(clientRefs) {
+        return withStore('readwrite', store => clientRefs.forEach(ref => store.delete(ref)));
+    }
+
+    // Send every queued completion; entries the server has answered for
+    // (created, duplicate or rejected) are dropped, the rest stay queued.
+    async function flush() {
+        const entries = await all();
+        if (entries.length === 0) {
+            return [];
+        }
+
+        const response = await fetch('/api/completions/bulk', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ completions: entries })
+        });
+        if (!response.ok) {
+            throw new Error(`Replay failed with status ${response.status}`);
+        }
+
+        const result = await response.json();
+        await remove(result.results.map(r => r.client_ref));
+        return result.results;
+    }
+
+    return { add, all, flush };
+})();
@@ -0,0 +1,78 @@
+// Service worker for the kid dashboard: caches the page shell and today's
+// quests so a tablet that drops off Wi-Fi keeps working, and replays queued
+// completions when the connection comes back.
+importScripts('/static/offline-queue.js');
+
+const CACHE_NAME = 'chore-champions-v1';
+const SHELL_URLS = [
+    '/static/offline-queue.js',
+    'https://cdn.tailwindcss.com',
+    'https://cdn.jsdelivr.net/npm/canvas-confetti@1.6.0/dist/confetti.browser.min.js'
+];
+// API reads served from cache when the network is unavailable
+const CACHED_API_PATHS = ['/api/tasks/today', '/api/children'];
+
+self.addEventListener('install', event => {
+    event.waitUntil(caches.open(CACHE_NAME).then(cache => Promise.all(
+        SHELL_URLS.map(url => {
+            const request = new Request(url, { mode: url.startsWith('/') ? 'same-origin' : 'no-cors' });
+            return fetch(request).then(response => cache.put(request, response)).catch(() => {});
+        })
+    )));
+    self.skipWaiting();
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil(
+        caches.keys()
+            .then(keys => Promise.all(keys.filter(key => key !== CACHE_NAME).map(key => caches.delete(key))))
+            .then(() => self.clients.claim())
+    );
+});
+
+async function networkFirst(request) {
+    const cache = await caches.open(CACHE_NAME);
+    try {
+        const response = await fetch(request);
+        if (response.ok) {
+            cache.put(request, response.clone());
+        }
+        return response;
+    } catch (error) {
+        const cached = await cache.match(request);
+        if (cached) {
+            return cached;
+        }
+        throw error;
+    }
+}
+
+async function cacheFirst(request) {
+    const cached = await caches.match(request);
+    return cached || fetch(request);
+}
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    if (request.method !== 'GET') {
+        return;
+    }
+
+    const url = new URL(request.url);
+    if (url.origin !== self.location.origin) {
+        event.respondWith(cacheFirst(request));
+    } else if (request.mode === 'navigate' && url.pathname.startsWith('/kid/')) {
+        event.respondWith(networkFirst(request));
+    } else if (CACHED_API_PATHS.includes(url.pathname)) {
+        event.respondWith(networkFirst(request));
+    } else if (url.pathname.startsWith('/static/')) {
+        event.respondWith(cacheFirst(request));
+    }
+});
+
+// Background Sync (where supported) replays the queue even if the page is closed
+self.addEventListener('sync', event => {
+    if (event.tag === 'completion-queue') {
+        event.waitUntil(OfflineQueue.flush());
+    }
+});
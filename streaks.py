@@ -0,0 +1,218 @@
+"""Incremental streak engine built on per-child run segments.
+
+A child's streak days (days with an approved completion of a required daily
+task on which one was due) are kept as ``StreakSegment`` rows, one per run
+of consecutive days. The ledger adds a day when a streak-counting completion
+arrives and removes it once the last such completion that day is gone:
+adding a day extends or joins the neighbouring runs, removing one shrinks or
+splits only the run it falls in. A week reset closes the open runs, so later
+days start a new one.
+
+``Child.streak_count`` and ``last_completion_date`` mirror the latest open
+run and ``Child.longest_streak`` the longest run ever, so reading a streak
+never rescans completion history. An open run only counts as the current
+streak while it reaches today or yesterday (see ``current_streak``).
+"""
+from datetime import timedelta
+
+from sqlalchemy import func
+
+from calendar_bits import day_bit, streak_bits, to_int
+from models import Child, ChildEvent, CompletionBitmap, StreakSegment, Task
+
+def _segments(session, child_id):
+    return session.query(StreakSegment).filter(StreakSegment.child_id == child_id)
+
+def _segment_on(session, child_id, day):
+    return _segments(session, child_id).filter(
+        StreakSegment.start_date <= day,
+        StreakSegment.end_date >= day
+    ).first()
+
+def _new_segment(child, start, end, closed=False):
+    segment = StreakSegment(household_id=child.household_id, child_id=child.id, closed=closed)
+    _set_bounds(segment, start, end)
+    return segment
+
+def _set_bounds(segment, start, end):
+    segment.start_date = start
+    segment.end_date = end
+    segment.length = (end - start).days + 1
+
+def _refresh_current(session, child):
+    """Copy the latest open run onto the child's streak_count and last_completion_date"""
+    current = _segments(session, child.id).filter(
+        StreakSegment.closed == False
+    ).order_by(StreakSegment.end_date.desc()).first()
+    child.streak_count = current.length if current is not None else 0
+    child.last_completion_date = current.end_date if current is not None else None
+
+def current_streak(streak_count, last_completion_date, today):
+    """The streak still running on ``today``; a run that ended before yesterday has lapsed"""
+    if last_completion_date is None or last_completion_date < today - timedelta(days=1):
+        return 0
+    return streak_count or 0
+
+def _refresh_longest(session, child):
+    child.longest_streak = session.query(func.max(StreakSegment.length)).filter(
+        StreakSegment.child_id == child.id
+    ).scalar() or 0
+
+def _is_streak_day(session, child_id, day):
+    """Whether the child still has a completion of a required daily task on that day"""
+    for (bits,) in session.query(CompletionBitmap.bits).join(Task, Task.id == CompletionBitmap.task_id).filter(
+        CompletionBitmap.child_id == child_id,
+        CompletionBitmap.year == day.year,
+        Task.category == 'DAILY',
+        Task.is_required == True
+    ):
+        if to_int(bits) & day_bit(day):
+            return True
+    return False
+
+def _resets(session, child_id):
+    return session.query(ChildEvent.event_date).filter(
+        ChildEvent.child_id == child_id,
+        ChildEvent.kind == 'reset',
+        ChildEvent.event_date != None
+    )
+
+def _reset_on(session, child_id, day):
+    return _resets(session, child_id).filter(ChildEvent.event_date == day).first() is not None
+
+def add_streak_day(session, child, day):
+    """Add a streak day to a child's runs; a day already in a run is a no-op. Caller commits."""
+    ensure_streak_segments(session, child)
+    if _segment_on(session, child.id, day) is not None:
+        return
+
+    # Runs never join across a week reset, which falls on the first day it cleared
+    before = after = None
+    if not _reset_on(session, child.id, day):
+        before = _segments(session, child.id).filter(StreakSegment.end_date == day - timedelta(days=1)).first()
+    if not _reset_on(session, child.id, day + timedelta(days=1)):
+        after = _segments(session, child.id).filter(StreakSegment.start_date == day + timedelta(days=1)).first()
+
+    if before is not None and after is not None:
+        _set_bounds(before, before.start_date, after.end_date)
+        before.closed = after.closed
+        session.delete(after)
+        segment = before
+    elif before is not None:
+        _set_bounds(before, before.start_date, day)
+        segment = before
+    elif after is not None:
+        _set_bounds(after, day, after.end_date)
+        segment = after
+    else:
+        latest_reset = _resets(session, child.id).order_by(ChildEvent.event_date.desc()).first()
+        segment = _new_segment(child, day, day, closed=latest_reset is not None and day < latest_reset[0])
+        session.add(segment)
+
+    child.longest_streak = max(child.longest_streak or 0, segment.length)
+    _refresh_current(session, child)
+
+def remove_streak_day(session, child, day):
+    """Drop a streak day unless another streak-counting completion remains on it. Caller commits.
+
+    Call after the completion's bitmap bit has been cleared.
+    """
+    ensure_streak_segments(session, child)
+    segment = _segment_on(session, child.id, day)
+    if segment is None or _is_streak_day(session, child.id, day):
+        return
+
+    was_longest = segment.length >= (child.longest_streak or 0)
+    if segment.start_date == segment.end_date:
+        session.delete(segment)
+    elif day == segment.start_date:
+        _set_bounds(segment, day + timedelta(days=1), segment.end_date)
+    elif day == segment.end_date:
+        _set_bounds(segment, segment.start_date, day - timedelta(days=1))
+    else:
+        session.add(_new_segment(child, day + timedelta(days=1), segment.end_date, segment.closed))
+        _set_bounds(segment, segment.start_date, day - timedelta(days=1))
+
+    if was_longest:
+        _refresh_longest(session, child)
+    _refresh_current(session, child)
+
+def close_streaks(session, child, reset_day):
+    """Close the runs ending before a week reset's first cleared day. Caller commits."""
+    ensure_streak_segments(session, child)
+    for segment in _segments(session, child.id).filter(
+        StreakSegment.closed == False,
+        StreakSegment.end_date < reset_day
+    ):
+        segment.closed = True
+    _refresh_current(session, child)
+
+def ensure_streak_segments(session, child):
+    """Lock the child's runs for this transaction, building them from history the first time"""
+    # Concurrent completions for one child must not both start the same run
+    session.query(Child.id).filter(Child.id == child.id).with_for_update().first()
+    if child.longest_streak is None:
+        rebuild_streak_segments(session, child)
+
+def _runs(bits, start):
+    """(first day, last day) of each run of set bits, bit 0 being ``start``"""
+    offset = 0
+    while bits:
+        gap = (bits & -bits).bit_length() - 1
+        bits >>= gap
+        offset += gap
+        length = (bits ^ (bits + 1)).bit_length() - 1
+        yield start + timedelta(days=offset), start + timedelta(days=offset + length - 1)
+        bits >>= length
+        offset += length
+
+def day_runs(days):
+    """(first day, last day) of each run of consecutive days in a sorted list"""
+    runs = []
+    for day in days:
+        if runs and runs[-1][1] == day - timedelta(days=1):
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return [tuple(run) for run in runs]
+
+def segment_bounds(runs, resets):
+    """(start, end, closed) segments for runs of streak days, given the sorted week reset days.
+
+    Runs are split at every reset; those ending before the latest reset are
+    closed.
+    """
+    latest_reset = resets[-1] if resets else None
+    bounds = []
+    for first, last in runs:
+        for reset_day in resets:
+            if first < reset_day <= last:
+                bounds.append((first, reset_day - timedelta(days=1), True))
+                first = reset_day
+        bounds.append((first, last, latest_reset is not None and last < latest_reset))
+    return bounds
+
+def rebuild_streak_segments(session, child, days=None):
+    """Replace a child's runs with ones rebuilt from history. Caller commits.
+
+    ``days`` are the child's sorted streak days; by default they are read
+    from its completion bitmaps.
+    """
+    for segment in _segments(session, child.id):
+        session.delete(segment)
+
+    runs = _runs(*streak_bits(session, child.id)) if days is None else day_runs(days)
+    resets = sorted(day for (day,) in _resets(session, child.id).distinct())
+    for first, last, closed in segment_bounds(runs, resets):
+        session.add(_new_segment(child, first, last, closed))
+
+    session.flush()
+    _refresh_longest(session, child)
+    _refresh_current(session, child)
+
+def build_missing_streak_segments(session):
+    """Build runs for every child that has none yet (e.g. after an upgrade); caller commits"""
+    children = session.query(Child).filter(Child.longest_streak == None).all()
+    for child in children:
+        rebuild_streak_segments(session, child)
+    return len(children)
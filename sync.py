@@ -0,0 +1,88 @@
+"""Delta sync: build /api/sync payloads from the change log."""
+from datetime import datetime, timedelta
+from sqlalchemy import func
+
+from models import ChangeLog, TaskCompletion
+from services import household_today
+from serializers import ChildDTO, TaskDTO, CompletionDTO, BadgeDTO
+
+# Completion history included in a full (cursor-less) snapshot
+SNAPSHOT_COMPLETION_DAYS = 7
+
+# Change log ids are assigned when a change is logged but only become visible
+# when its transaction commits, so on PostgreSQL a lower id can appear after a
+# higher one. Entries logged this recently may still be in flight, so cursors
+# handed to clients stop short of them and the next sync reads them again.
+SYNC_SETTLE_SECONDS = 120
+
+# Payload key -> (change log table name, row DTO)
+SYNC_COLLECTIONS = {
+    'children': ('children', ChildDTO),
+    'tasks': ('tasks', TaskDTO),
+    'completions': ('task_completions', CompletionDTO),
+    'badges': ('badges', BadgeDTO),
+}
+
+def get_current_cursor(session):
+    """Highest change log id, or 0 for an empty log"""
+    return session.query(func.max(ChangeLog.id)).scalar() or 0
+
+def get_safe_cursor(session, current):
+    """Cursor to hand back to a client: just below the oldest entry still settling.
+
+    Every entry up to it has committed (or never will), so a client resuming
+    from it cannot skip one; ``current`` is the highest id already read.
+    """
+    settling_since = datetime.utcnow() - timedelta(seconds=SYNC_SETTLE_SECONDS)
+    first_settling = session.query(func.min(ChangeLog.id)).filter(
+        ChangeLog.changed_at >= settling_since,
+        ChangeLog.id <= current
+    ).scalar()
+    return current if first_settling is None else first_settling - 1
+
+def get_full_snapshot(session):
+    """Everything a fresh client needs, plus the cursor to sync from next"""
+    cursor = get_current_cursor(session)
+    since_date = household_today(session) - timedelta(days=SNAPSHOT_COMPLETION_DAYS)
+
+    payload = {'cursor': get_safe_cursor(session, cursor), 'full': True, 'deleted': {}}
+    for key, (_table_name, dto) in SYNC_COLLECTIONS.items():
+        statement = dto.select()
+        if dto.model is TaskCompletion:
+            statement = statement.where(TaskCompletion.date >= since_date)
+        payload[key] = dto.from_rows(session.execute(statement))
+        payload['deleted'][key] = []
+    return payload
+
+def get_changes_since(session, since):
+    """Rows inserted/updated and ids deleted after cursor ``since``.
+
+    Each changed row is returned once with its current state; a row that no
+    longer exists is reported as deleted, whatever happened in between.
+    Returns a full snapshot if the cursor is unknown (e.g. ahead of the log).
+
+    Cursors are change log ids. The cursor returned trails the log by the
+    settle window (see SYNC_SETTLE_SECONDS), so recent rows are sent again on
+    the next sync; they carry their current state, so applying them twice is
+    harmless.
+    """
+    cursor = get_current_cursor(session)
+    if since <= 0 or since > cursor:
+        return get_full_snapshot(session)
+
+    changed = session.query(ChangeLog.table_name, ChangeLog.row_id).filter(
+        ChangeLog.id > since,
+        ChangeLog.id <= cursor
+    ).distinct().all()
+
+    changed_ids = {}
+    for table_name, row_id in changed:
+        changed_ids.setdefault(table_name, set()).add(row_id)
+
+    payload = {'cursor': get_safe_cursor(session, cursor), 'full': False, 'deleted': {}}
+    for key, (table_name, dto) in SYNC_COLLECTIONS.items():
+        row_ids = changed_ids.get(table_name, set())
+        rows = dto.from_rows(session.execute(dto.select().where(dto.model.id.in_(row_ids)))) if row_ids else []
+        payload[key] = rows
+        payload['deleted'][key] = sorted(row_ids - {row.id for row in rows})
+    return payload